@@ -1,17 +1,97 @@
+import math
 import os
+import time
 from dotenv import load_dotenv
-from flask import Flask
-from app.logger import logger
 
+# До импорта модулей приложения: они читают настройки из окружения при импорте
 load_dotenv()
 
+from flask import Flask, g, jsonify, request  # noqa: E402
+from werkzeug.middleware.proxy_fix import ProxyFix  # noqa: E402
+from app.logger import REQUEST_ID_HEADER, log_request, logger, new_request_id  # noqa: E402
+
+
 def create_app():
     app = Flask(__name__)
     app.secret_key = os.getenv("FLASK_SECRET_KEY", default="secret")
 
-    from . import routes
+    from . import cli, routes
+    from app.background import run_in_thread_loop
+    from app.database.config_db import db_session
+    from app.database.models import DatabaseNotInitializedError, check_db
+    from app.metrics import RATE_LIMITED, REQUEST_LATENCY, REQUESTS_IN_PROGRESS
+    from app.prewarm import PREWARM_ENABLED, forecast_prewarmer
+    from app.rate_limit import RATE_LIMIT_ENABLED, RATE_LIMIT_TRUST_PROXY, client_limiter, route_limit
+
+    # Асинхронные представления выполняются в постоянном цикле событий потока,
+    # чтобы соединения асинхронного клиента с Open-Meteo переживали запрос
+    app.async_to_sync = lambda func: lambda *args, **kwargs: run_in_thread_loop(func(*args, **kwargs))
+
+    if RATE_LIMIT_TRUST_PROXY:
+        # remote_addr - адрес, добавленный ближайшим доверенным прокси
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=RATE_LIMIT_TRUST_PROXY)
 
     app.register_blueprint(routes.bp)
+    app.register_blueprint(cli.bp)
+
+    @app.before_request
+    def assign_request_id():
+        # Регистрируется первым, чтобы идентификатор был во всех записях лога запроса
+        g.request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+
+    if PREWARM_ENABLED:
+        # Поток прогрева запускается в каждом воркере при первом запросе
+        app.before_request(forecast_prewarmer.start)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.request_route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUESTS_IN_PROGRESS.labels(g.request_route).inc()
+
+    if RATE_LIMIT_ENABLED:
+
+        @app.before_request
+        def limit_client_rate():
+            # Отказ до выполнения представления: лишние запросы не доходят ни до БД, ни до Open-Meteo
+            limit = route_limit(g.request_route)
+            if limit is None:
+                return None
+            retry_after = client_limiter.hit((request.remote_addr, g.request_route), *limit)
+            if not retry_after:
+                return None
+            RATE_LIMITED.labels(g.request_route).inc()
+            response = jsonify({"error": "Слишком много запросов, повторите позже"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            return response
+
+    @app.before_request
+    def require_database():
+        # Схема проверяется один раз на процесс; до `flask init-db` понятная ошибка вместо "no such table"
+        try:
+            check_db()
+        except DatabaseNotInitializedError as e:
+            logger.error("%s", e)
+            return jsonify({"error": "База данных не инициализирована"}), 503
+        return None
+
+    @app.after_request
+    def observe_request_metrics(response):
+        duration = time.perf_counter() - g.request_started
+        REQUEST_LATENCY.labels(request.method, g.request_route, response.status_code).observe(duration)
+        log_request(request.method, request.path, g.request_route, response.status_code, duration)
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        if "request_route" in g:
+            REQUESTS_IN_PROGRESS.labels(g.request_route).dec()
+
+    @app.teardown_appcontext
+    def remove_db_session(exception=None):
+        db_session.remove()
 
     logger.info("Application initialized")
     return app
@@ -1,51 +1,169 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
-import requests
+import httpx
+from sqlalchemy.orm import Session
 
+from app.cache import CacheEntry, create_cache
+from app.forecast_series import ExtendedForecast
+from app.database.request_db import get_cities_coords, get_city_coords, update_city_location
+from app.http_client import UpstreamError, async_fetch_json, fetch_json, get_async_client
 from app.logger import logger
+from app.metrics import UPSTREAM_ERRORS
+from app.rate_limit import upstream_budget
+from app.singleflight import SingleFlight
 
 DEFAULT_LANGUAGE = "ru"
-API_TIMEOUT = 10
 
+# Адреса API Open-Meteo; для нагрузочных тестов можно указать локальную
+# заглушку (см. benchmarks/mock_openmeteo.py)
+GEOCODING_API_URL = os.getenv("GEOCODING_API_URL", "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_API_URL = os.getenv("FORECAST_API_URL", "https://api.open-meteo.com/v1/forecast")
 
-def request_api(url: str) -> dict:
+# Координаты городов практически не меняются, а текущая погода
+# в Open-Meteo обновляется примерно раз в 15 минут.
+COORDS_CACHE_TTL = int(os.getenv("COORDS_CACHE_TTL", 7 * 24 * 3600))
+COORDS_CACHE_SIZE = int(os.getenv("COORDS_CACHE_SIZE", 10000))
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", 15 * 60))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 2000))
+# Просроченный прогноз отдается сразу, пока не прошло столько секунд после
+# истечения TTL, а обновляется в фоне (stale-while-revalidate)
+FORECAST_STALE_WHILE_REVALIDATE = int(os.getenv("FORECAST_STALE_WHILE_REVALIDATE", 300))
+# Максимальный возраст прогноза, который показывается при недоступности Open-Meteo
+FORECAST_MAX_STALE = int(os.getenv("FORECAST_MAX_STALE", 6 * 3600))
+FORECAST_REFRESH_WORKERS = int(os.getenv("FORECAST_REFRESH_WORKERS", 4))
+# Точность округления координат для ключа кэша прогноза (~1 км)
+COORDS_PRECISION = 2
+
+WEATHER_PARAMS = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "apparent_temperature",
+    "wind_speed_10m",
+    "precipitation",
+    "surface_pressure",
+]
+
+# Расширенный прогноз: почасовой на EXTENDED_FORECAST_HOURS часов и посуточный
+# на EXTENDED_FORECAST_DAYS дней; Open-Meteo пересчитывает его примерно раз в час
+EXTENDED_FORECAST_HOURS = int(os.getenv("EXTENDED_FORECAST_HOURS", 48))
+EXTENDED_FORECAST_DAYS = int(os.getenv("EXTENDED_FORECAST_DAYS", 7))
+EXTENDED_CACHE_TTL = int(os.getenv("EXTENDED_CACHE_TTL", 3600))
+EXTENDED_CACHE_SIZE = int(os.getenv("EXTENDED_CACHE_SIZE", 5000))
+
+HOURLY_PARAMS = [
+    "temperature_2m",
+    "apparent_temperature",
+    "precipitation_probability",
+    "precipitation",
+    "wind_speed_10m",
+]
+DAILY_PARAMS = [
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "precipitation_sum",
+    "wind_speed_10m_max",
+]
+
+# Максимум городов в одном пакетном запросе и параллельных геокодирований
+BATCH_MAX_CITIES = int(os.getenv("BATCH_MAX_CITIES", 50))
+BATCH_GEOCODE_WORKERS = int(os.getenv("BATCH_GEOCODE_WORKERS", 8))
+
+# Каталог для координации одинаковых запросов между воркерами (необязательно)
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR") or None
+
+# Тип хранилища задает CACHE_BACKEND (см. app/cache.py); с общим хранилищем
+# воркеры не запрашивают одни и те же координаты и прогнозы каждый для себя
+coords_cache = create_cache("coords", maxsize=COORDS_CACHE_SIZE, ttl=COORDS_CACHE_TTL)
+forecast_cache = create_cache(
+    "forecast", maxsize=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL, retain=FORECAST_MAX_STALE
+)
+extended_cache = create_cache(
+    "extended", maxsize=EXTENDED_CACHE_SIZE, ttl=EXTENDED_CACHE_TTL, retain=FORECAST_MAX_STALE
+)
+
+geocode_flight = SingleFlight("geocode", lock_dir=SINGLEFLIGHT_DIR)
+forecast_flight = SingleFlight("forecast", lock_dir=SINGLEFLIGHT_DIR)
+extended_flight = SingleFlight("extended", lock_dir=SINGLEFLIGHT_DIR)
+weather_flight = SingleFlight("weather", lock_dir=SINGLEFLIGHT_DIR)
+
+# Фоновое обновление просроченных прогнозов; потоки создаются при первой задаче
+forecast_refresher = ThreadPoolExecutor(max_workers=FORECAST_REFRESH_WORKERS, thread_name_prefix="forecast-refresh")
+_refreshing: set[Tuple[float, float]] = set()
+_refreshing_lock = threading.Lock()
+
+
+def _endpoint(url: str) -> str:
+    """Название API для метрик по адресу запроса."""
+    return "geocode" if url.startswith(GEOCODING_API_URL) else "forecast"
+
+
+def _acquire_budget(endpoint: str) -> bool:
+    """
+    Занимает место в бюджете обращений к Open-Meteo (см. app.rate_limit).
+    Запрос сверх бюджета считается неудачным: вызывающий код отдаст
+    устаревшие данные, если они есть.
+    """
+    if upstream_budget.acquire():
+        return True
+    UPSTREAM_ERRORS.labels(endpoint, "budget").inc()
+    logger.warning("Запрос к %s отклонен: исчерпан бюджет обращений к Open-Meteo", endpoint)
+    return False
+
+
+def request_api(url: str) -> Optional[dict]:
     """Отправка запроса в api погоды"""
+    endpoint = _endpoint(url)
+    if not _acquire_budget(endpoint):
+        return None
     try:
-        response = requests.get(url, timeout=API_TIMEOUT)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"Ошибка при выполнении запроса: {e}")
+        return fetch_json(url, endpoint)
+    except UpstreamError as e:
+        logger.error("Ошибка при выполнении запроса: %s", e)
         return None
+    finally:
+        upstream_budget.release()
 
 
-def get_coords_by_name_city(city_name: str) -> Optional[Tuple[float, float]]:
-    """
-    Получает координаты города по его названию.
+async def async_request_api(client: httpx.AsyncClient, url: str) -> Optional[dict]:
+    """Асинхронная отправка запроса в api погоды"""
+    endpoint = _endpoint(url)
+    if not _acquire_budget(endpoint):
+        return None
+    try:
+        return await async_fetch_json(client, url, endpoint)
+    except UpstreamError as e:
+        logger.error("Ошибка при выполнении запроса: %s", e)
+        return None
+    finally:
+        upstream_budget.release()
 
-    Args:
-        city_name (str): Название города
 
-    Returns:
-        Optional[Tuple[float, float]]: Кортеж (широта, долгота) или None в случае ошибки
-    """
+def _coords_cache_key(city_name: str) -> str:
+    return city_name.strip().casefold()
+
 
-    url = (
-        f"https://geocoding-api.open-meteo.com/v1/search?"
+def _geocoding_url(city_name: str) -> str:
+    return (
+        f"{GEOCODING_API_URL}?"
         f"name={city_name}"
         f"&count=1"
         f"&language={DEFAULT_LANGUAGE}"
     )
-    logger.debug(f"Запрос координат для города: {city_name}")
 
-    response = request_api(url)
 
+def _parse_location(city_name: str, response: Optional[dict]) -> Optional[dict]:
+    """Извлекает координаты и метаданные города из ответа геокодера."""
     if response is None:
-        logger.error(f"Не удалось получить координаты для города: {city_name}")
+        logger.error("Не удалось получить координаты для города: %s", city_name)
         return None
 
     results = response.get("results")
     if not results or len(results) == 0:
-        logger.info(f"Город не найден: {city_name}")
+        logger.info("Город не найден: %s", city_name)
         return None
 
     location = results[0]
@@ -53,63 +171,653 @@ def get_coords_by_name_city(city_name: str) -> Optional[Tuple[float, float]]:
     lon = location.get("longitude")
 
     if lat is None or lon is None:
-        logger.error(f"Неполные координаты в ответе: {location}")
+        logger.error("Неполные координаты в ответе: %s", location)
         return None
 
-    return lat, lon
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "country": location.get("country"),
+        "timezone": location.get("timezone"),
+    }
 
 
-def get_weather(city: str) -> Optional[dict]:
+def get_location_by_name_city(city_name: str) -> Optional[dict]:
     """
-    Получает текущую погоду для указанного города.
+    Геокодирует город через Open-Meteo.
+
+    Args:
+        city_name (str): Название города
+
+    Returns:
+        Optional[dict]: Словарь с ключами latitude, longitude, country, timezone
+        или None в случае ошибки
+    """
+    return _parse_location(city_name, _geocode(city_name))
+
+
+def _geocode(city_name: str) -> Optional[dict]:
+    """Ответ геокодера как есть (None при ошибке): по нему отличают ненайденный город от сбоя."""
+    logger.debug("Запрос координат для города: %s", city_name)
+    return geocode_flight.do(_coords_cache_key(city_name), lambda: request_api(_geocoding_url(city_name)))
+
+
+async def async_get_location_by_name_city(
+    client: httpx.AsyncClient, city_name: str
+) -> Optional[dict]:
+    """Асинхронная версия get_location_by_name_city."""
+    logger.debug("Запрос координат для города: %s", city_name)
+
+    response = await geocode_flight.do_async(
+        _coords_cache_key(city_name), lambda: async_request_api(client, _geocoding_url(city_name))
+    )
+    return _parse_location(city_name, response)
+
+
+def get_coords_by_name_city(city_name: str) -> Optional[Tuple[float, float]]:
+    """
+    Получает координаты города по его названию.
+
+    Args:
+        city_name (str): Название города
+
+    Returns:
+        Optional[Tuple[float, float]]: Кортеж (широта, долгота) или None в случае ошибки
+    """
+    cache_key = _coords_cache_key(city_name)
+    cached = coords_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    location = get_location_by_name_city(city_name)
+    if location is None:
+        return None
+
+    coords = location["latitude"], location["longitude"]
+    coords_cache.set(cache_key, coords)
+    return coords
+
+
+async def async_get_coords_by_name_city(
+    client: httpx.AsyncClient, city_name: str
+) -> Optional[Tuple[float, float]]:
+    """Асинхронная версия get_coords_by_name_city."""
+    cache_key = _coords_cache_key(city_name)
+    cached = coords_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    location = await async_get_location_by_name_city(client, city_name)
+    if location is None:
+        return None
+
+    coords = location["latitude"], location["longitude"]
+    coords_cache.set(cache_key, coords)
+    return coords
+
+
+def resolve_city_coords(city: str, db: Optional[Session] = None) -> Optional[Tuple[float, float]]:
+    """
+    Определяет координаты города: кэш процесса, затем таблица cities,
+    и только при промахе - геокодирование Open-Meteo с сохранением в БД.
 
     Args:
         city (str): Название города
+        db (Optional[Session]): Сессия базы данных; без нее БД не используется
+
+    Returns:
+        Optional[Tuple[float, float]]: Кортеж (широта, долгота) или None в случае ошибки
+    """
+    cache_key = _coords_cache_key(city)
+    cached = coords_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if db is None:
+        return get_coords_by_name_city(city)
+
+    coords = get_city_coords(db, city)
+    if coords is not None:
+        coords_cache.set(cache_key, coords)
+        return coords
+
+    location = get_location_by_name_city(city)
+    if location is None:
+        return None
+
+    update_city_location(db, city, location)
+    coords = location["latitude"], location["longitude"]
+    coords_cache.set(cache_key, coords)
+    return coords
+
+
+async def async_resolve_city_coords(
+    client: httpx.AsyncClient, city: str, db: Optional[Session] = None
+) -> Optional[Tuple[float, float]]:
+    """Асинхронная версия resolve_city_coords."""
+    cache_key = _coords_cache_key(city)
+    cached = coords_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if db is None:
+        return await async_get_coords_by_name_city(client, city)
+
+    coords = get_city_coords(db, city)
+    if coords is not None:
+        coords_cache.set(cache_key, coords)
+        return coords
+
+    location = await async_get_location_by_name_city(client, city)
+    if location is None:
+        return None
+
+    update_city_location(db, city, location)
+    coords = location["latitude"], location["longitude"]
+    coords_cache.set(cache_key, coords)
+    return coords
+
+
+def _forecast_cache_key(lat: float, lon: float) -> Tuple[float, float]:
+    return round(lat, COORDS_PRECISION), round(lon, COORDS_PRECISION)
+
+
+def _forecast_url(cache_keys: list[Tuple[float, float]]) -> str:
+    """Формирует запрос прогноза; несколько точек передаются списками через запятую."""
+    return (
+        f"{FORECAST_API_URL}?"
+        f"latitude={','.join(str(lat) for lat, _ in cache_keys)}"
+        f"&longitude={','.join(str(lon) for _, lon in cache_keys)}"
+        f"&current={','.join(WEATHER_PARAMS)}"
+        f"&timezone=auto"
+    )
+
+
+def _mark_stale(entry: CacheEntry) -> dict:
+    """Копия устаревшего прогноза с пометкой stale и возрастом в секундах."""
+    forecast = dict(entry.value)
+    forecast["stale"] = True
+    forecast["age"] = int(entry.age)
+    return forecast
+
+
+def _store_forecast(cache_key: Tuple[float, float], result: Optional[dict]) -> Optional[dict]:
+    """
+    Кэширует ответ прогноза или, если API недоступен, возвращает последнее
+    известное значение не старше FORECAST_MAX_STALE с пометкой stale.
+    """
+    if not result or not result.get("current"):
+        stale = forecast_cache.get_entry(cache_key)
+        if stale is None or stale.age > FORECAST_MAX_STALE:
+            return None
+        logger.warning("Используется устаревший прогноз для %s, возраст %.0f с", cache_key, stale.age)
+        return _mark_stale(stale)
+
+    forecast_cache.set(cache_key, result["current"])
+    return result["current"]
+
+
+def _refresh_forecast(cache_key: Tuple[float, float]) -> None:
+    try:
+        forecast_flight.do(
+            cache_key,
+            lambda: request_api(_forecast_url([cache_key])),
+            store=lambda response: _store_forecast(cache_key, response),
+        )
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(cache_key)
+
+
+def _cached_forecast(cache_key: Tuple[float, float]) -> Optional[dict]:
+    """
+    Прогноз из кэша без обращения к API.
+
+    Свежая запись возвращается как есть. Запись, просроченная не более чем
+    на FORECAST_STALE_WHILE_REVALIDATE секунд, возвращается с пометкой stale,
+    а обновление запускается в фоне (не более одного на точку).
+
+    Returns:
+        Optional[dict]: Копия прогноза или None, если нужен запрос к API
+    """
+    cached = forecast_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    entry = forecast_cache.get_entry(cache_key)
+    if entry is None or time.time() - entry.expires_at > FORECAST_STALE_WHILE_REVALIDATE:
+        return None
+
+    with _refreshing_lock:
+        schedule = cache_key not in _refreshing
+        _refreshing.add(cache_key)
+    if schedule:
+        forecast_refresher.submit(_refresh_forecast, cache_key)
+    return _mark_stale(entry)
+
+
+def get_forecast_by_coords(lat: float, lon: float) -> Optional[dict]:
+    """
+    Получает текущую погоду по координатам с кэшированием.
+
+    Args:
+        lat (float): Широта
+        lon (float): Долгота
+
+    Returns:
+        Optional[dict]: Блок "current" ответа Open-Meteo или None в случае ошибки.
+        Устаревшие данные (см. _cached_forecast, _store_forecast) содержат
+        ключи "stale": True и "age" - возраст в секундах
+    """
+    cache_key = _forecast_cache_key(lat, lon)
+    cached = _cached_forecast(cache_key)
+    if cached is not None:
+        return cached
+
+    result = forecast_flight.do(
+        cache_key,
+        lambda: request_api(_forecast_url([cache_key])),
+        store=lambda response: _store_forecast(cache_key, response),
+    )
+    return dict(result) if result else None
+
+
+async def async_get_forecast_by_coords(
+    client: httpx.AsyncClient, lat: float, lon: float
+) -> Optional[dict]:
+    """Асинхронная версия get_forecast_by_coords."""
+    cache_key = _forecast_cache_key(lat, lon)
+    cached = _cached_forecast(cache_key)
+    if cached is not None:
+        return cached
+
+    async def fetch() -> Optional[dict]:
+        return await async_request_api(client, _forecast_url([cache_key]))
+
+    result = await forecast_flight.do_async(
+        cache_key, fetch, store=lambda response: _store_forecast(cache_key, response)
+    )
+    return dict(result) if result else None
+
+
+def forecast_ttl_left(lat: float, lon: float) -> float:
+    """Сколько секунд прогноз для точки еще будет считаться свежим (0, если его нет в кэше)."""
+    entry = forecast_cache.get_entry(_forecast_cache_key(lat, lon))
+    if entry is None:
+        return 0.0
+    return max(0.0, entry.expires_at - time.time())
+
+
+def extended_ttl_left(lat: float, lon: float) -> float:
+    """Сколько секунд расширенный прогноз для точки еще будет считаться свежим (0, если его нет в кэше)."""
+    entry = extended_cache.get_entry(_forecast_cache_key(lat, lon))
+    if entry is None:
+        return 0.0
+    return max(0.0, entry.expires_at - time.time())
+
+
+def weather_ttl_left(city: str) -> float:
+    """
+    Сколько секунд текущая погода и расширенный прогноз города еще будут
+    считаться свежими (0, если чего-то из них нет в кэше).
+    """
+    coords = coords_cache.get_entry(_coords_cache_key(city))
+    if coords is None:
+        return 0.0
+    return min(forecast_ttl_left(*coords.value), extended_ttl_left(*coords.value))
+
+
+def _batch_items(response: Optional[object], count: int) -> list[Optional[dict]]:
+    """
+    Разбирает ответ пакетного запроса по точкам: для одной точки Open-Meteo
+    возвращает объект, для нескольких - список.
+    """
+    if response is None:
+        logger.error("Не удалось получить пакетный прогноз для %s точек", count)
+        return [None] * count
+    items = response if isinstance(response, list) else [response]
+    if len(items) != count:
+        logger.error("Ответ пакетного прогноза содержит %s точек вместо %s", len(items), count)
+        return [None] * count
+    return items
+
+
+def get_forecasts_by_coords(
+    coords_list: list[Tuple[float, float]],
+    force: bool = False,
+) -> dict[Tuple[float, float], Optional[dict]]:
+    """
+    Получает текущую погоду для нескольких точек одним запросом к Open-Meteo.
+
+    Точки, найденные в кэше, в запрос не попадают.
+
+    Args:
+        coords_list (list[Tuple[float, float]]): Список координат (широта, долгота)
+        force (bool): Запросить все точки заново, не заглядывая в кэш
+
+    Returns:
+        dict: Блок "current" (или None) по округленным координатам,
+        см. _forecast_cache_key
+    """
+    forecasts: dict[Tuple[float, float], Optional[dict]] = {}
+    missing: list[Tuple[float, float]] = []
+
+    for lat, lon in coords_list:
+        cache_key = _forecast_cache_key(lat, lon)
+        if cache_key in forecasts or cache_key in missing:
+            continue
+        cached = None if force else _cached_forecast(cache_key)
+        if cached is not None:
+            forecasts[cache_key] = cached
+        else:
+            missing.append(cache_key)
+
+    if not missing:
+        return forecasts
+
+    items = _batch_items(request_api(_forecast_url(missing)), len(missing))
+    for cache_key, item in zip(missing, items):
+        result = _store_forecast(cache_key, item)
+        forecasts[cache_key] = dict(result) if result else None
+
+    return forecasts
+
+
+def refresh_weather_by_coords(coords_list: list[Tuple[float, float]]) -> dict[Tuple[float, float], bool]:
+    """
+    Заново запрашивает текущую погоду и расширенный прогноз для нескольких
+    точек одним запросом к Open-Meteo и сохраняет их в кэши
+    (forecast_cache и extended_cache), как страница города.
+
+    Args:
+        coords_list (list[Tuple[float, float]]): Список координат (широта, долгота)
+
+    Returns:
+        dict: По округленным координатам - получены ли свежие данные
+    """
+    cache_keys = list(dict.fromkeys(_forecast_cache_key(lat, lon) for lat, lon in coords_list))
+    if not cache_keys:
+        return {}
+
+    items = _batch_items(request_api(_weather_url(cache_keys)), len(cache_keys))
+    refreshed = {}
+    for cache_key, item in zip(cache_keys, items):
+        weather_data = _store_forecast(cache_key, _current_response(item))
+        forecast = _store_extended(cache_key, item)
+        refreshed[cache_key] = bool(weather_data) and not weather_data.get("stale") and forecast is not None
+    return refreshed
+
+
+def get_weather_batch(cities: list[str], db: Optional[Session] = None) -> list[dict]:
+    """
+    Получает текущую погоду для нескольких городов.
+
+    Координаты берутся из кэша и одним запросом из таблицы cities,
+    недостающие геокодируются параллельно в пределах бюджета обращений
+    к Open-Meteo. Прогнозы для всех городов запрашиваются одним запросом.
+    Городам, которые не удалось геокодировать из-за бюджета или сбоя
+    Open-Meteo, возвращается "Сервис временно недоступен", а не "Город не найден".
+
+    Args:
+        cities (list[str]): Названия городов
+        db (Optional[Session]): Сессия базы данных
+
+    Returns:
+        list[dict]: По одному элементу на город в исходном порядке:
+            {"city": str, "weather": dict} или {"city": str, "error": str}
+    """
+    coords: dict[str, Optional[Tuple[float, float]]] = {}
+    for city in cities:
+        cached = coords_cache.get(_coords_cache_key(city))
+        if cached is not None:
+            coords[city] = cached
+
+    unresolved = [city for city in cities if city not in coords]
+    if unresolved and db is not None:
+        for city, city_coords in get_cities_coords(db, unresolved).items():
+            coords[city] = city_coords
+            coords_cache.set(_coords_cache_key(city), city_coords)
+        unresolved = [city for city in unresolved if city not in coords]
+
+    unavailable: set[str] = set()
+    if unresolved:
+        # Геокодируем не больше, чем пропустит бюджет Open-Meteo (один запрос
+        # остается на пакетный прогноз), остальные города сразу получают ошибку
+        allowed = max(0, min(len(unresolved), upstream_budget.available() - 1))
+        unavailable.update(unresolved[allowed:])
+        unresolved = unresolved[:allowed]
+
+    if unresolved:
+        workers = max(1, min(BATCH_GEOCODE_WORKERS, len(unresolved)))
+        if upstream_budget.max_concurrency > 0:
+            workers = min(workers, upstream_budget.max_concurrency)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Копия контекста для каждой задачи: в потоках доступны контекст
+            # приложения и g, поэтому в логах виден request_id, а время
+            # обращений к Open-Meteo попадает в итог запроса
+            futures = [executor.submit(contextvars.copy_context().run, _geocode, city) for city in unresolved]
+            responses = [future.result() for future in futures]
+
+        for city, response in zip(unresolved, responses):
+            location = _parse_location(city, response)
+            if location is None:
+                if response is None:
+                    unavailable.add(city)
+                coords[city] = None
+                continue
+            if db is not None:
+                update_city_location(db, city, location)
+            coords[city] = location["latitude"], location["longitude"]
+            coords_cache.set(_coords_cache_key(city), coords[city])
+
+    forecasts = get_forecasts_by_coords([c for c in coords.values() if c is not None])
+
+    results = []
+    for city in cities:
+        if city in unavailable:
+            results.append({"city": city, "error": "Сервис временно недоступен"})
+            continue
+
+        city_coords = coords.get(city)
+        if city_coords is None:
+            results.append({"city": city, "error": "Город не найден"})
+            continue
+
+        weather_data = forecasts.get(_forecast_cache_key(*city_coords))
+        if not weather_data:
+            results.append({"city": city, "error": "Не удалось получить данные о погоде"})
+            continue
+
+        results.append({"city": city, "weather": dict(weather_data)})
+
+    return results
+
+
+def _extended_url(cache_keys: list[Tuple[float, float]]) -> str:
+    """Почасовой и посуточный прогноз; несколько точек, как в _forecast_url."""
+    return (
+        f"{FORECAST_API_URL}?"
+        f"latitude={','.join(str(lat) for lat, _ in cache_keys)}"
+        f"&longitude={','.join(str(lon) for _, lon in cache_keys)}"
+        f"&hourly={','.join(HOURLY_PARAMS)}"
+        f"&daily={','.join(DAILY_PARAMS)}"
+        f"&forecast_hours={EXTENDED_FORECAST_HOURS}"
+        f"&forecast_days={EXTENDED_FORECAST_DAYS}"
+        f"&timeformat=unixtime"
+        f"&timezone=auto"
+    )
+
+
+def _store_extended(cache_key: Tuple[float, float], response: Optional[dict]) -> Optional[ExtendedForecast]:
+    """
+    Разбирает и кэширует расширенный прогноз или, если API недоступен,
+    возвращает последний известный не старше FORECAST_MAX_STALE.
+    """
+    forecast = None
+    if response:
+        try:
+            forecast = ExtendedForecast.from_response(response)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error("Некорректный ответ расширенного прогноза для %s: %s", cache_key, e)
+
+    if forecast is None:
+        stale = extended_cache.get_entry(cache_key)
+        if stale is None or stale.age > FORECAST_MAX_STALE:
+            return None
+        logger.warning("Используется устаревший расширенный прогноз для %s, возраст %.0f с", cache_key, stale.age)
+        return stale.value
+
+    extended_cache.set(cache_key, forecast)
+    return forecast
+
+
+def get_extended_forecast_by_coords(lat: float, lon: float) -> Optional[ExtendedForecast]:
+    """
+    Получает почасовой и посуточный прогноз по координатам с кэшированием.
+
+    Args:
+        lat (float): Широта
+        lon (float): Долгота
+
+    Returns:
+        Optional[ExtendedForecast]: Прогноз в колоночном виде или None в случае ошибки
+    """
+    cache_key = _forecast_cache_key(lat, lon)
+    cached = extended_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    return extended_flight.do(
+        cache_key,
+        lambda: request_api(_extended_url([cache_key])),
+        store=lambda response: _store_extended(cache_key, response),
+    )
+
+
+async def async_get_extended_forecast_by_coords(
+    client: httpx.AsyncClient, lat: float, lon: float
+) -> Optional[ExtendedForecast]:
+    """Асинхронная версия get_extended_forecast_by_coords."""
+    cache_key = _forecast_cache_key(lat, lon)
+    cached = extended_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    async def fetch() -> Optional[dict]:
+        return await async_request_api(client, _extended_url([cache_key]))
+
+    return await extended_flight.do_async(
+        cache_key, fetch, store=lambda response: _store_extended(cache_key, response)
+    )
+
+
+def _forecast_slices(city: str, forecast: ExtendedForecast, hours: int, days: int) -> dict:
+    now = time.time()
+    return {
+        "city": city,
+        "hourly": forecast.hourly.slice(now, hours),
+        "daily": forecast.daily.slice(now, days),
+    }
+
+
+def get_extended_forecast(city: str, db: Optional[Session] = None, hours: int = 24, days: int = 7) -> Optional[dict]:
+    """
+    Получает почасовой прогноз на ближайшие hours часов и посуточный на days дней.
+
+    Args:
+        city (str): Название города
+        db (Optional[Session]): Сессия базы данных для чтения и сохранения координат
+        hours (int): Сколько часов почасового прогноза вернуть, начиная с текущего
+        days (int): Сколько дней посуточного прогноза вернуть, начиная с сегодняшнего
 
     Returns:
         Optional[dict]: Словарь с данными о погоде или None в случае ошибки
 
     Пример возвращаемого значения:
         {
-            "time": "2025-06-01T16:45",
-            "temperature_2m": 23.5,
-            "apparent_temperature": 23.3,
-            "relative_humidity_2m": 65,
-            "wind_speed_10m": 4.8,
-            "precipitation": 0.0,
-            "surface_pressure": 1012.5,
             "city": "Екатеринбург",
+            "hourly": {"time": ["2025-06-01T16:00", ...], "temperature_2m": [23.5, ...], ...},
+            "daily": {"time": ["2025-06-01", ...], "temperature_2m_max": [25.1, ...], ...},
         }
     """
-    coords_city = get_coords_by_name_city(city)
-
+    coords_city = resolve_city_coords(city, db)
     if coords_city is None:
         logger.info("Координаты не полученны")
         return None
 
-    weather_params = [
-        "temperature_2m",
-        "relative_humidity_2m",
-        "apparent_temperature",
-        "wind_speed_10m",
-        "precipitation",
-        "surface_pressure",
-    ]
-
-    url = (
-        f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={coords_city[0]}"
-        f"&longitude={coords_city[1]}"
-        f"&current={','.join(weather_params)}"
-        f"&timezone=auto"
-    )
-
-    result = request_api(url)
-    if not result:
-        logger.error(f"Не удалось получить погоду для города: {city}")
+    forecast = get_extended_forecast_by_coords(*coords_city)
+    if forecast is None:
+        logger.error("Не удалось получить расширенный прогноз для города: %s", city)
         return None
 
-    weather_data = result.get("current")
+    return _forecast_slices(city, forecast, hours, days)
+
+
+def _weather_url(cache_keys: list[Tuple[float, float]]) -> str:
+    """Текущая погода вместе с почасовым и посуточным прогнозом одним запросом."""
+    return f"{_extended_url(cache_keys)}&current={','.join(WEATHER_PARAMS)}"
+
+
+def _current_response(response: Optional[dict]) -> Optional[dict]:
+    """
+    Ответ с блоком current в том же виде, что и от _forecast_url: в общем
+    запросе timeformat=unixtime, а в кэше время текущей погоды хранится
+    строкой в местном времени.
+    """
+    if not response or not isinstance(response.get("current"), dict):
+        return response
+    current = dict(response["current"])
+    if isinstance(current.get("time"), (int, float)):
+        local_time = current["time"] + int(response.get("utc_offset_seconds") or 0)
+        current["time"] = time.strftime("%Y-%m-%dT%H:%M", time.gmtime(local_time))
+    return {"current": current}
+
+
+async def async_get_weather_with_forecast(
+    city: str, db: Optional[Session] = None, hours: int = 24, days: int = 7
+) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Текущая погода и расширенный прогноз для страницы города.
+
+    Если в кэше нет ни того, ни другого, оба запрашиваются у Open-Meteo
+    одним запросом; если устарело что-то одно, запрашивается только оно.
+
+    Returns:
+        Tuple[Optional[dict], Optional[dict]]: Текущая погода (блок "current"
+        с ключом "city"; у устаревших данных - "stale" и "age") и срезы
+        расширенного прогноза, см. get_extended_forecast (None, если данных нет)
+    """
+    client = get_async_client()
+    coords_city = await async_resolve_city_coords(client, city, db)
+    if coords_city is None:
+        logger.info("Координаты не полученны")
+        return None, None
+
+    cache_key = _forecast_cache_key(*coords_city)
+    weather_data = _cached_forecast(cache_key)
+    forecast = extended_cache.get(cache_key)
+
+    if weather_data is None and forecast is None:
+
+        async def fetch() -> Optional[dict]:
+            return await async_request_api(client, _weather_url([cache_key]))
+
+        def store(response: Optional[dict]) -> Tuple[Optional[dict], Optional[ExtendedForecast]]:
+            return _store_forecast(cache_key, _current_response(response)), _store_extended(cache_key, response)
+
+        weather_data, forecast = await weather_flight.do_async(cache_key, fetch, store=store)
+        weather_data = dict(weather_data) if weather_data else None
+    elif weather_data is None:
+        weather_data = await async_get_forecast_by_coords(client, *coords_city)
+    elif forecast is None:
+        forecast = await async_get_extended_forecast_by_coords(client, *coords_city)
+
+    if not weather_data:
+        logger.error("Не удалось получить погоду для города: %s", city)
+        return None, None
     weather_data["city"] = city
 
-    return weather_data
+    if forecast is None:
+        logger.error("Не удалось получить расширенный прогноз для города: %s", city)
+        return weather_data, None
+    return weather_data, _forecast_slices(city, forecast, hours, days)
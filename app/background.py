@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import os
+import threading
+from typing import Any, Callable, Coroutine, Optional
+
+from app.logger import logger
+
+
+class PeriodicTask:
+    """
+    Фоновая задача, выполняющаяся в daemon-потоке с заданным интервалом.
+
+    Поток запускается лениво при первом вызове start() в каждом процессе,
+    поэтому задача корректно переживает fork воркеров gunicorn.
+    trigger() позволяет выполнить задачу досрочно.
+    """
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Запускает поток задачи, если он еще не запущен в текущем процессе."""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._wakeup = threading.Event()
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._pid = pid
+            self._thread.start()
+
+    def trigger(self) -> None:
+        """Выполнить задачу, не дожидаясь окончания интервала."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает поток задачи."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.fn()
+            except Exception as e:
+                logger.error("Ошибка фоновой задачи %s: %s", self.name, e)
+
+
+_thread_loops = threading.local()
+
+
+def run_in_thread_loop(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Выполняет корутину в постоянном цикле событий текущего потока.
+
+    Flask по умолчанию создает новый цикл событий на каждый вызов
+    асинхронного представления, и вместе с ним пропадают соединения
+    асинхронного HTTP-клиента (см. app.http_client.get_async_client).
+    Здесь цикл создается один раз на поток и процесс, а корутина
+    выполняется в копии текущего контекста, поэтому видит request и g.
+    """
+    pid = os.getpid()
+    runner = getattr(_thread_loops, "runner", None)
+    if runner is None or _thread_loops.pid != pid:
+        runner = asyncio.Runner()
+        _thread_loops.runner, _thread_loops.pid = runner, pid
+    return runner.run(coro, context=contextvars.copy_context())
@@ -0,0 +1,417 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+
+from app.database.config_db import DB_PATH
+from app.forecast_series import ExtendedForecast
+from app.logger import logger
+from app.metrics import CACHE_REQUESTS
+
+# Где хранить кэши внешнего API: memory - отдельно в каждом процессе,
+# sqlite - общий файл для всех воркеров хоста, redis - общий сервер
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+# По умолчанию рядом с БД приложения, а не в общем для всех пользователей /tmp
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH") or os.path.join(os.path.dirname(DB_PATH), "weather-cache.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class CacheEntry(NamedTuple):
+    """Запись кэша вместе с метаданными о свежести."""
+
+    value: Any
+    stored_at: float
+    expires_at: float
+
+    @property
+    def age(self) -> float:
+        """Возраст записи в секундах."""
+        return max(0.0, time.time() - self.stored_at)
+
+    @property
+    def is_fresh(self) -> bool:
+        """True, если время жизни записи ещё не истекло."""
+        return time.time() < self.expires_at
+
+
+def _to_json(value: Any) -> Any:
+    """Значение кэша в виде, пригодном для JSON; кортежи и прогнозы помечаются типом."""
+    if isinstance(value, ExtendedForecast):
+        return {"__type__": "extended", "value": value.to_json()}
+    if isinstance(value, tuple):
+        return {"__type__": "tuple", "value": [_to_json(item) for item in value]}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    return value
+
+
+def _from_json(data: dict) -> Any:
+    kind = data.get("__type__")
+    if kind == "tuple":
+        return tuple(data["value"])
+    if kind == "extended":
+        return ExtendedForecast.from_json(data["value"])
+    return data
+
+
+def dump_value(value: Any) -> bytes:
+    """
+    Сериализует значение для общих хранилищ.
+
+    Используется JSON, а не pickle: файл кэша или сервер Redis доступны не
+    только приложению, и подмененная запись не должна выполнять код.
+    """
+    return json.dumps(_to_json(value), ensure_ascii=False).encode()
+
+
+def load_value(payload: bytes) -> Any:
+    """
+    Восстанавливает значение, сохраненное dump_value.
+
+    Raises:
+        ValueError: Если запись повреждена или записана в другом формате
+    """
+    try:
+        return json.loads(payload, object_hook=_from_json)
+    except (KeyError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректная запись кэша: {e}") from e
+
+
+class CacheBackend:
+    """
+    Интерфейс кэша с временем жизни записей.
+
+    Реализации отличаются тем, где лежат данные: TTLCache - в памяти процесса,
+    SQLiteCache - в общем файле хоста, RedisCache - на сервере Redis.
+    Просроченные записи остаются доступны через get_entry() (в памяти - до
+    вытеснения, в общих хранилищах - еще retain секунд), что позволяет отдать
+    последнее известное значение, если внешний API недоступен.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает свежее значение по ключу или None."""
+        entry = self.get_entry(key)
+        value = entry.value if entry is not None and entry.is_fresh else None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_REQUESTS.labels(self.name, "miss" if value is None else "hit").inc()
+        return value
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        """Возвращает запись по ключу, даже если она просрочена. Не влияет на счетчики."""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение на ttl секунд (по умолчанию - на время жизни кэша)."""
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        """Удаляет запись по ключу."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Очищает кэш и сбрасывает счетчики."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Статистика использования кэша (счетчики - только текущего процесса)."""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "name": self.name,
+            "backend": type(self).__name__,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+
+class TTLCache(CacheBackend):
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с ограниченным размером
+    и временем жизни записей.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(name, maxsize, ttl)
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает свежее значение по ключу или None."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or not entry.is_fresh:
+                self.misses += 1
+                value = None
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = entry.value
+        CACHE_REQUESTS.labels(self.name, "miss" if value is None else "hit").inc()
+        return value
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        """Возвращает запись по ключу, даже если она просрочена. Не влияет на счетчики."""
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение, вытесняя наименее используемые записи при переполнении."""
+        now = time.time()
+        entry = CacheEntry(value, now, now + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Удаляет запись по ключу."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Очищает кэш и сбрасывает счетчики."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Кэш в файле SQLite (WAL), общий для всех процессов хоста.
+
+    Воркеры gunicorn видят записи друг друга, поэтому прогноз для точки
+    запрашивается у Open-Meteo один раз на хост, а не в каждом воркере.
+    Значения хранятся в JSON (см. dump_value), файл создается с правами 0600. Вместо LRU при переполнении удаляются
+    самые старые записи: учет обращений превратил бы каждое чтение в запись.
+    """
+
+    # Как часто (в записях) проверять переполнение и удалять старые записи
+    PRUNE_EVERY = 100
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str = CACHE_SQLITE_PATH, retain: float = 0.0):
+        super().__init__(name, maxsize, ttl)
+        self.path = path
+        self.retain = retain
+        self._local = threading.local()
+        self._writes = 0
+        # Файл и таблица создаются при первом обращении в каждом процессе, а не
+        # при импорте: соединения не наследуются воркерами через fork
+        self._schema_pid: Optional[int] = None
+        self._schema_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока; после fork открывается заново."""
+        pid = os.getpid()
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != pid:
+            # Файлы WAL и shm SQLite создает с правами основного файла
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, pid
+        if self._schema_pid != pid:
+            with self._schema_lock:
+                if self._schema_pid != pid:
+                    self._create_schema(connection)
+                    self._schema_pid = pid
+        return connection
+
+    @staticmethod
+    def _create_schema(connection: sqlite3.Connection) -> None:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " cache TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " stored_at REAL NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (cache, key)) WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_stored ON cache_entries (cache, stored_at)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        return self._connection().execute(sql, params).fetchall()
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        try:
+            rows = self._execute(
+                "SELECT value, stored_at, expires_at FROM cache_entries WHERE cache = ? AND key = ?",
+                (self.name, repr(key)),
+            )
+        except sqlite3.Error as e:
+            logger.warning("Кэш %s: ошибка чтения SQLite: %s", self.name, e)
+            return None
+        if not rows:
+            return None
+        value, stored_at, expires_at = rows[0]
+        try:
+            return CacheEntry(load_value(value), stored_at, expires_at)
+        except ValueError as e:
+            logger.warning("Кэш %s: %s", self.name, e)
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        try:
+            self._execute(
+                "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+                (self.name, repr(key), dump_value(value), now, now + (self.ttl if ttl is None else ttl)),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+        except sqlite3.Error as e:
+            logger.warning("Кэш %s: ошибка записи SQLite: %s", self.name, e)
+
+    def _prune(self, now: float) -> None:
+        """Удаляет записи старше срока хранения и самые старые сверх maxsize."""
+        self._execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND expires_at < ?",
+            (self.name, now - self.retain),
+        )
+        self._execute(
+            "DELETE FROM cache_entries WHERE cache = ? AND stored_at <= ("
+            " SELECT stored_at FROM cache_entries WHERE cache = ?"
+            " ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+            (self.name, self.name, self.maxsize),
+        )
+
+    def delete(self, key: Hashable) -> None:
+        self._execute("DELETE FROM cache_entries WHERE cache = ? AND key = ?", (self.name, repr(key)))
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM cache_entries WHERE cache = ?", (self.name,))
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return self._execute("SELECT count(*) FROM cache_entries WHERE cache = ?", (self.name,))[0][0]
+
+
+class RedisCache(CacheBackend):
+    """
+    Кэш на сервере Redis, общий для всех процессов и хостов.
+
+    Клиент передается снаружи, поэтому вместо redis.Redis можно подставить
+    совместимую заглушку (в тестах - tests.fake_redis.FakeRedis). Используются только
+    get, set(ex=...), delete и scan_iter. Размер ограничивает политика
+    maxmemory сервера, а не maxsize. Значения хранятся в JSON (см. dump_value).
+    Если Redis недоступен, кэш работает как пустой: чтение дает промах,
+    запись и удаление пропускаются.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, client: Any, retain: float = 0.0):
+        super().__init__(name, maxsize, ttl)
+        self.client = client
+        self.retain = retain
+        self.prefix = f"weather:{name}:"
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        try:
+            payload = self.client.get(self.prefix + repr(key))
+            return CacheEntry(*load_value(payload)) if payload is not None else None
+        except Exception as e:  # тип ошибки зависит от клиента
+            logger.warning("Кэш %s: ошибка чтения Redis: %s", self.name, e)
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        # Redis удаляет запись сам, но не раньше, чем истечет срок хранения устаревших данных
+        payload = dump_value([value, now, now + ttl])
+        try:
+            self.client.set(self.prefix + repr(key), payload, ex=max(1, int(ttl + self.retain)))
+        except Exception as e:
+            logger.warning("Кэш %s: ошибка записи Redis: %s", self.name, e)
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self.client.delete(self.prefix + repr(key))
+        except Exception as e:
+            logger.warning("Кэш %s: ошибка удаления в Redis: %s", self.name, e)
+
+    def clear(self) -> None:
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + "*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:
+            logger.warning("Кэш %s: ошибка очистки Redis: %s", self.name, e)
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        try:
+            return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+        except Exception as e:
+            logger.warning("Кэш %s: ошибка чтения Redis: %s", self.name, e)
+            return 0
+
+
+_redis_client = None
+
+
+def get_redis_client() -> Any:
+    """Клиент Redis по REDIS_URL, общий для кэшей процесса."""
+    global _redis_client
+
+    if _redis_client is None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Для CACHE_BACKEND=redis установите пакет redis") from e
+        _redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis_client
+
+
+def create_cache(name: str, maxsize: int, ttl: float, retain: float = 0.0) -> CacheBackend:
+    """
+    Создает кэш выбранного в CACHE_BACKEND типа.
+
+    Args:
+        name (str): Имя кэша для метрик и ключей общих хранилищ
+        maxsize (int): Максимальное количество записей
+        ttl (float): Время жизни записи в секундах
+        retain (float): Сколько секунд общие хранилища держат просроченную
+            запись для get_entry(); кэш в памяти держит ее до вытеснения
+
+    Raises:
+        ValueError: Если CACHE_BACKEND не memory, sqlite или redis
+    """
+    if CACHE_BACKEND == "memory":
+        return TTLCache(name, maxsize, ttl)
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(name, maxsize, ttl, retain=retain)
+    if CACHE_BACKEND == "redis":
+        return RedisCache(name, maxsize, ttl, get_redis_client(), retain=retain)
+    raise ValueError(f"Неизвестный CACHE_BACKEND: {CACHE_BACKEND}")
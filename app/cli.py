@@ -0,0 +1,53 @@
+import time
+
+import click
+from flask import Blueprint
+
+bp = Blueprint("cli", __name__, cli_group=None)
+
+
+@bp.cli.command("init-db")
+def init_db_command():
+    """Создает таблицы БД и применяет миграции. Выполняется до запуска приложения."""
+    from app.database.config_db import DB_PATH
+    from app.database.models import init_db
+
+    started = time.perf_counter()
+    init_db()
+    click.echo(f"База данных {DB_PATH} готова за {time.perf_counter() - started:.2f} с")
+
+
+@bp.cli.command("import-cities")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["geonames", "csv"]),
+    default="geonames",
+    show_default=True,
+    help="geonames - TSV-выгрузка GeoNames, csv - CSV с заголовком name,latitude,longitude,...",
+)
+@click.option("--batch-size", default=5000, show_default=True, help="Строк в одной транзакции")
+@click.option("--min-population", default=0, show_default=True, help="Пропускать города с меньшим населением")
+@click.option("--ascii-names", is_flag=True, help="GeoNames: брать название из колонки asciiname")
+@click.option(
+    "--feature-class",
+    "feature_classes",
+    multiple=True,
+    default=["P"],
+    show_default=True,
+    help="GeoNames: загружаемые классы объектов (P - населенные пункты), можно указать несколько раз",
+)
+def import_cities_command(path, file_format, batch_size, min_population, ascii_names, feature_classes):
+    """Загружает справочник городов с координатами для автодополнения."""
+    from app.database.gazetteer import import_cities, read_csv, read_geonames
+
+    started = time.perf_counter()
+    with open(path, encoding="utf-8", newline="") as file:
+        if file_format == "geonames":
+            rows = read_geonames(file, ascii_names, feature_classes)
+        else:
+            rows = read_csv(file)
+        total = import_cities(rows, batch_size=batch_size, min_population=min_population)
+
+    click.echo(f"Загружено {total} городов за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,112 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.background import PeriodicTask
+from app.database.config_db import get_engine
+from app.database.models import City, SearchEvent, SearchStatsDaily, SearchStatsHourly
+from app.logger import logger
+
+ANALYTICS_ROLLUP_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL", 60))
+ANALYTICS_HOURLY_RETENTION_HOURS = int(os.getenv("ANALYTICS_HOURLY_RETENTION_HOURS", 48))
+ANALYTICS_DAILY_RETENTION_DAYS = int(os.getenv("ANALYTICS_DAILY_RETENTION_DAYS", 90))
+
+# Формат совпадает с тем, как SQLAlchemy хранит DateTime в SQLite
+HOUR_BUCKET_FORMAT = "%Y-%m-%d %H:00:00.000000"
+DAY_BUCKET_FORMAT = "%Y-%m-%d 00:00:00.000000"
+
+# Окно -> (таблица агрегатов, длительность окна, размер корзины)
+TOP_WINDOWS = {
+    "1h": (SearchStatsHourly, timedelta(hours=1), timedelta(hours=1)),
+    "24h": (SearchStatsHourly, timedelta(hours=24), timedelta(hours=1)),
+    "7d": (SearchStatsDaily, timedelta(days=7), timedelta(days=1)),
+}
+
+
+def _rollup_into(conn, model, bucket_format: str) -> None:
+    """Прибавляет события журнала к агрегатам model по корзинам bucket_format."""
+    bucket = func.strftime(bucket_format, SearchEvent.searched_at)
+    stmt = sqlite_insert(model).from_select(
+        ["bucket", "city_id", "count"],
+        select(bucket, SearchEvent.city_id, func.count()).group_by(bucket, SearchEvent.city_id),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[model.bucket, model.city_id],
+        set_={"count": model.count + stmt.excluded.count},
+    )
+    conn.execute(stmt)
+
+
+def rollup_search_events() -> int:
+    """
+    Сворачивает журнал поисков в почасовые и посуточные агрегаты.
+
+    Все шаги выполняются в одной транзакции: первая же запись захватывает
+    блокировку SQLite, поэтому новые события не появятся между агрегацией и
+    удалением, и каждое событие учитывается ровно один раз, даже если
+    свертку одновременно запускают несколько воркеров. Заодно удаляются
+    агрегаты старше срока хранения.
+
+    Returns:
+        int: Количество свернутых событий
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with get_engine().begin() as conn:
+        _rollup_into(conn, SearchStatsHourly, HOUR_BUCKET_FORMAT)
+        _rollup_into(conn, SearchStatsDaily, DAY_BUCKET_FORMAT)
+        events = conn.execute(delete(SearchEvent)).rowcount
+        conn.execute(
+            delete(SearchStatsHourly).where(
+                SearchStatsHourly.bucket < now - timedelta(hours=ANALYTICS_HOURLY_RETENTION_HOURS)
+            )
+        )
+        conn.execute(
+            delete(SearchStatsDaily).where(SearchStatsDaily.bucket < now - timedelta(days=ANALYTICS_DAILY_RETENTION_DAYS))
+        )
+
+    if events:
+        logger.debug("Свернуто событий поиска: %s", events)
+    return events
+
+
+def get_top_cities(db: Session, window: str, limit: int = 10) -> List[Tuple[str, int]]:
+    """
+    Самые искомые города за окно времени по агрегатам (журнал не читается).
+
+    Окно выравнивается по корзинам: в него входит текущая неполная корзина
+    и все корзины, начавшиеся не раньше чем window назад, поэтому результат
+    может захватывать до одной лишней корзины. Поиски, еще не свернутые
+    фоновой задачей, появляются с задержкой до ANALYTICS_ROLLUP_INTERVAL.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        window (str): Окно из TOP_WINDOWS
+        limit (int): Максимальное количество городов
+
+    Returns:
+        List[Tuple[str, int]]: Пары (название города, количество поисков)
+    """
+    model, duration, bucket_size = TOP_WINDOWS[window]
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - duration
+    if bucket_size == timedelta(days=1):
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        since = since.replace(minute=0, second=0, microsecond=0)
+
+    total = func.sum(model.count).label("total")
+    rows = db.execute(
+        select(City.name, total)
+        .join(City, City.id == model.city_id)
+        .where(model.bucket >= since)
+        .group_by(model.city_id)
+        .order_by(total.desc(), City.name)
+        .limit(limit)
+    ).all()
+    return [(name, count) for name, count in rows]
+
+
+search_rollup = PeriodicTask("search-rollup", ANALYTICS_ROLLUP_INTERVAL, rollup_search_events)
@@ -0,0 +1,244 @@
+import heapq
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.background import PeriodicTask
+from app.cache import TTLCache
+from app.database.config_db import Session as SessionFactory
+from app.database.fuzzy_index import TrigramIndex
+from app.database.models import City, SearchHistory
+from app.logger import logger
+
+CITY_INDEX_REFRESH_INTERVAL = float(os.getenv("CITY_INDEX_REFRESH_INTERVAL", 300))
+CITY_INDEX_RESULT_CACHE_SIZE = int(os.getenv("CITY_INDEX_RESULT_CACHE_SIZE", 5000))
+AUTOCOMPLETE_TRANSLIT = os.getenv("AUTOCOMPLETE_TRANSLIT", "1") == "1"
+
+
+def fold_name(name: str) -> str:
+    """Нормализует название для поиска без учета регистра (в т.ч. для кириллицы, ё = е)."""
+    return name.strip().casefold().replace("ё", "е")
+
+
+class CityPrefixIndex:
+    """
+    Индекс названий городов в памяти процесса для автодополнения.
+
+    Нормализованные названия хранятся в отсортированном массиве, поиск по
+    префиксу - два двоичных поиска, результаты ранжируются по популярности
+    (SearchHistory.count), а при равенстве - по населению из справочника
+    городов. Массивы обновляются копированием при записи,
+    поэтому чтение не требует блокировок.
+
+    Для нечеткого поиска после первого запроса в фоне строится триграммный
+    индекс (см. TrigramIndex), который затем обновляется вместе с основным.
+
+    Индекс загружается из БД при первом обращении, дополняется при создании
+    городов в этом процессе и периодически перечитывается в фоне, чтобы
+    увидеть изменения других воркеров.
+    """
+
+    def __init__(self, refresh_interval: float, result_cache_size: int):
+        # (нормализованные названия, исходные названия) - заменяются целиком
+        self._entries: tuple[List[str], List[str]] = ([], [])
+        self._popularity: dict[str, int] = {}
+        self._population: dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        self._fuzzy: Optional[TrigramIndex] = None
+        self._fuzzy_building = False
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._results = TTLCache("autocomplete", maxsize=result_cache_size, ttl=refresh_interval)
+        # Значения limit, с которыми кэшировались результаты по префиксу
+        self._result_limits: set[int] = set()
+        self._refresh_task = PeriodicTask("city-index-refresh", refresh_interval, self.reload)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def load(self, db: Session) -> None:
+        """
+        Полностью перестраивает индекс из таблицы cities.
+
+        Args:
+            db (Session): Сессия базы данных SQLAlchemy
+        """
+        rows = (
+            db.query(City.name, func.coalesce(SearchHistory.count, 0), City.population)
+            .outerjoin(SearchHistory, City.id == SearchHistory.city_id)
+            .all()
+        )
+        entries = sorted((fold_name(name), name) for name, _, _ in rows)
+        popularity = {name: count for name, count, _ in rows}
+        population = {name: people for name, _, people in rows if people}
+
+        fuzzy = None
+        if self._fuzzy is not None:
+            fuzzy = TrigramIndex(translit=AUTOCOMPLETE_TRANSLIT)
+            fuzzy.extend(entries)
+
+        with self._write_lock:
+            if fuzzy is not None:
+                self._fuzzy = fuzzy
+            self._entries = ([key for key, _ in entries], [name for _, name in entries])
+            self._popularity = popularity
+            self._population = population
+            self._loaded_at = time.time()
+            self._results.clear()
+
+        logger.debug("Индекс городов загружен: %s записей", len(entries))
+
+    def reload(self) -> None:
+        """Перечитывает индекс в отдельной сессии (для фоновой задачи)."""
+        db = SessionFactory()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Загружает индекс при первом обращении и запускает фоновое обновление."""
+        if not self.is_loaded:
+            with self._load_lock:
+                if not self.is_loaded:
+                    self.load(db)
+        self._refresh_task.start()
+
+    def add_city(self, name: str) -> None:
+        """Добавляет новый город в индекс."""
+        key = fold_name(name)
+        with self._write_lock:
+            if name in self._popularity:
+                return
+            keys, names = list(self._entries[0]), list(self._entries[1])
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            names.insert(position, name)
+            self._entries = (keys, names)
+            if self._fuzzy is not None:
+                self._fuzzy.add(key, name)
+            self._popularity[name] = 0
+            self._results.clear()
+
+    def record_search(self, name: str, count: int = 1) -> None:
+        """
+        Учитывает поиск города в рейтинге популярности.
+
+        Из кэша результатов удаляются только выдачи по префиксам этого
+        города: порядок остальных не меняется. Нечеткие результаты обновятся
+        по истечении времени жизни кэша.
+        """
+        if name not in self._popularity:
+            self.add_city(name)
+        with self._write_lock:
+            self._popularity[name] = self._popularity.get(name, 0) + count
+
+        key = fold_name(name)
+        for limit in tuple(self._result_limits):
+            for end in range(1, len(key) + 1):
+                self._results.delete((key[:end], limit))
+
+    def search(self, prefix: str, limit: int) -> List[str]:
+        """
+        Ищет города по префиксу без учета регистра.
+
+        Args:
+            prefix (str): Префикс названия
+            limit (int): Максимальное количество результатов
+
+        Returns:
+            List[str]: Названия городов, самые популярные первыми
+        """
+        key = fold_name(prefix)
+        if not key:
+            return []
+
+        cache_key = (key, limit)
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        (keys, names), popularity, population = self._entries, self._popularity, self._population
+        start = bisect_left(keys, key)
+        end = bisect_right(keys, key + "\U0010ffff", lo=start)
+
+        best = heapq.nsmallest(
+            limit,
+            range(start, end),
+            key=lambda i: (-popularity.get(names[i], 0), -population.get(names[i], 0), keys[i]),
+        )
+        result = [names[i] for i in best]
+        self._result_limits.add(limit)
+        self._results.set(cache_key, result)
+        return list(result)
+
+    def _build_fuzzy(self) -> None:
+        keys, names = self._entries
+        fuzzy = TrigramIndex(translit=AUTOCOMPLETE_TRANSLIT)
+        fuzzy.extend(zip(keys, names))
+        with self._write_lock:
+            self._fuzzy = fuzzy
+            self._results.clear()
+        logger.debug("Триграммный индекс городов построен: %s записей", len(fuzzy))
+
+    def _get_fuzzy(self) -> Optional[TrigramIndex]:
+        """
+        Возвращает триграммный индекс. При первом обращении запускает его
+        построение в фоне, чтобы не задерживать запрос; до готовности
+        индекса нечеткий поиск ничего не находит.
+        """
+        if self._fuzzy is None:
+            with self._load_lock:
+                if self._fuzzy is None and not self._fuzzy_building:
+                    self._fuzzy_building = True
+                    threading.Thread(target=self._build_fuzzy, name="city-index-fuzzy", daemon=True).start()
+        return self._fuzzy
+
+    def fuzzy_search(self, query: str, limit: int) -> List[str]:
+        """
+        Нечеткий поиск: опечатки, совпадения с середины слова и транслитерация.
+
+        Args:
+            query (str): Строка поиска
+            limit (int): Максимальное количество результатов
+
+        Returns:
+            List[str]: Названия городов, ближайшие и самые популярные первыми
+        """
+        key = fold_name(query)
+        if not key:
+            return []
+
+        cache_key = ("~", key, limit)
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
+        fuzzy = self._get_fuzzy()
+        if fuzzy is None:
+            return []
+
+        popularity, population = self._popularity, self._population
+        matches = sorted(
+            fuzzy.search(key),
+            key=lambda m: (m[0], -popularity.get(m[1], 0), -population.get(m[1], 0), m[1]),
+        )
+
+        result: List[str] = []
+        for _, name in matches:
+            if name not in result:
+                result.append(name)
+            if len(result) == limit:
+                break
+
+        self._results.set(cache_key, result)
+        return list(result)
+
+
+city_index = CityPrefixIndex(CITY_INDEX_REFRESH_INTERVAL, CITY_INDEX_RESULT_CACHE_SIZE)
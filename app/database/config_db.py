@@ -1,33 +1,153 @@
 import os
-from sqlalchemy import QueuePool, create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+import threading
+import time
+from typing import Optional
+
+from flask import g, has_app_context
+from sqlalchemy import Engine, QueuePool, create_engine, event
+from sqlalchemy.orm import Session as OrmSession, sessionmaker, scoped_session
+
+from app.logger import record_timing
+from app.metrics import DB_POOL_WAIT, DB_QUERY_LATENCY, statement_type
 
 
 DB_NAME = "site.db"
-DB_PATH = os.path.join(os.path.dirname(__file__), DB_NAME)
+DB_PATH = os.getenv("DB_PATH") or os.path.join(os.path.dirname(__file__), DB_NAME)
 SQLALCHEMY_DATABASE_URI = f"sqlite:///{DB_PATH}"
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+
+# Профили настроек SQLite. "performance" включает WAL: читатели не блокируются
+# писателем, а synchronous=NORMAL в режиме WAL не рискует целостностью БД.
+DB_PROFILES = {
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -20000,  # в КиБ, т.е. ~20 МБ
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "busy_timeout": 5000,
+        "temp_store": "DEFAULT",
+    },
+}
+DB_PROFILE = os.getenv("DB_PROFILE", "performance")
+
+
+def get_sqlite_pragmas() -> dict:
+    """
+    Возвращает PRAGMA-настройки SQLite для выбранного профиля.
 
-def create_db_engine() -> create_engine:
+    Любую настройку профиля можно переопределить переменной окружения
+    SQLITE_<ИМЯ>, например SQLITE_BUSY_TIMEOUT=10000.
+
+    Returns:
+        dict: Имя PRAGMA -> значение
+    """
+    pragmas = dict(DB_PROFILES.get(DB_PROFILE, DB_PROFILES["performance"]))
+    for name in pragmas:
+        override = os.getenv(f"SQLITE_{name.upper()}")
+        if override:
+            pragmas[name] = override
+    return pragmas
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, измеряющий время ожидания свободного соединения."""
+
+    def _do_get(self):
+        with DB_POOL_WAIT.time():
+            return super()._do_get()
+
+
+def create_db_engine() -> Engine:
     """
     Создает и возвращает движок SQLAlchemy с настроенным пулом соединений.
 
     Returns:
-        create_engine: Настроенный экземпляр движка SQLAlchemy
+        Engine: Настроенный экземпляр движка SQLAlchemy
     """
-    return create_engine(
+    db_engine = create_engine(
         SQLALCHEMY_DATABASE_URI,
-        poolclass=QueuePool,  # Используем пул соединений
-        pool_size=5,  # Максимальное количество соединений в пуле
-        max_overflow=10,  # Дополнительные соединения при нагрузке
+        poolclass=TimedQueuePool,  # Используем пул соединений
+        pool_size=DB_POOL_SIZE,  # Постоянные соединения, по одному на поток обработки запросов
+        max_overflow=DB_MAX_OVERFLOW,  # Дополнительные соединения при нагрузке
         pool_timeout=30,  # Время ожидания соединения (сек)
-        pool_recycle=3600,  # Пересоздавать соединения каждые час
         connect_args={"check_same_thread": False},  # Для SQLite в многопоточном режиме
         echo=False,  # Логировать SQL-запросы (True для отладки)
     )
+    pragmas = get_sqlite_pragmas()
+
+    @event.listens_for(db_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def observe_query_time(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_LATENCY.labels(statement_type(statement)).observe(elapsed)
+        record_timing("db", elapsed)
+
+    return db_engine
+
+
+_engine: Optional[Engine] = None
+_engine_pid: Optional[int] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """
+    Возвращает движок текущего процесса.
+
+    Движок создается при первом обращении, а не при импорте: импорт модуля
+    не открывает соединений, и процесс, созданный fork (воркер gunicorn),
+    получает собственный пул вместо соединений родителя.
+    """
+    global _engine, _engine_pid
+
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                _engine, _engine_pid = create_db_engine(), pid
+    return _engine
+
+
+def dispose_engine() -> None:
+    """
+    Сбрасывает движок, унаследованный от родительского процесса (post_fork в gunicorn.conf.py).
+
+    Соединения родителя не закрываются (close=False): ими продолжает
+    пользоваться сам родитель.
+    """
+    global _engine
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose(close=False)
+        _engine = None
 
 
-engine = create_db_engine()
+class ProcessSession(OrmSession):
+    """Сессия, которая берет соединения из движка текущего процесса."""
+
+    def get_bind(self, *args, **kwargs) -> Engine:
+        return get_engine()
 
 
 def create_session_factory() -> sessionmaker:
@@ -37,33 +157,45 @@ def create_session_factory() -> sessionmaker:
     Returns:
         sessionmaker: Настроенная фабрика сессий
     """
-    return sessionmaker(bind=engine, autoflush=True, autocommit=False, expire_on_commit=True)
+    return sessionmaker(class_=ProcessSession, autoflush=True, autocommit=False, expire_on_commit=True)
 
 
 Session = create_session_factory()
 
 
+def _session_scope() -> int:
+    """
+    Область жизни сессии: контекст приложения Flask (один запрос), а вне
+    его - текущий поток. Асинхронные представления выполняются в отдельном
+    потоке, но в том же контексте, поэтому получают ту же сессию.
+    """
+    if has_app_context():
+        return id(g._get_current_object())
+    return threading.get_ident()
+
+
+# Сессия текущего запроса; закрывается в teardown_appcontext (см. create_app)
+db_session = scoped_session(Session, scopefunc=_session_scope)
+
+
 def get_db():
     """
-    Генератор для получения сессии БД в контексте запроса.
-    Автоматически закрывает сессию после использования.
+    Генератор для получения отдельной сессии БД вне контекста запроса
+    (скрипты, фоновые задачи). Автоматически закрывает сессию после использования.
 
     Yields:
-        scoped_session: Сессия БД
+        Session: Сессия БД
 
     Пример работы:
-        def some_view():
+        def some_task():
             db = next(get_db())
             try:
                 # работа с БД
             finally:
                 db.close()
     """
-    db = scoped_session(Session)
+    db = Session()
     try:
         yield db
     finally:
-        db.remove()
-
-
-db_session = Session()
+        db.close()
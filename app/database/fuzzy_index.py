@@ -0,0 +1,142 @@
+from array import array
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+# Транслитерация кириллицы в латиницу (упрощенная, близкая к ГОСТ 7.79-2000 Б)
+TRANSLIT_TABLE = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+        "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+        "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+        "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+        "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    }
+)  # fmt: skip
+
+# Сколько кандидатов по совпадению триграмм проверять расстоянием редактирования
+FUZZY_CANDIDATES = 200
+# Триграммы, встречающиеся чаще этой доли названий, не используются для отбора
+FUZZY_STOP_RATIO = 0.2
+
+
+def transliterate(text: str) -> str:
+    """Переводит нормализованный текст в латиницу."""
+    return text.translate(TRANSLIT_TABLE)
+
+
+def trigrams(text: str) -> set[str]:
+    """Множество триграмм строки с пробелами по краям."""
+    padded = f" {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Расстояние Левенштейна с отсечением: если оно больше max_distance,
+    возвращает max_distance + 1.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Инвертированный триграммный индекс для нечеткого поиска названий.
+
+    Кандидаты отбираются по числу общих триграмм, затем
+    переранжируются по расстоянию редактирования до начала названия,
+    поэтому находятся опечатки, совпадения с середины слова и, при
+    включенной транслитерации, латинские написания кириллических названий.
+    Идентификаторы названий стабильны: новые названия только дописываются.
+    """
+
+    def __init__(self, translit: bool = True):
+        self.translit = translit
+        self._terms: List[str] = []
+        self._names: List[str] = []
+        self._postings: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _term(self, folded: str) -> str:
+        return transliterate(folded) if self.translit else folded
+
+    def add(self, folded: str, name: str) -> None:
+        """
+        Добавляет название в индекс.
+
+        Args:
+            folded (str): Нормализованное название (см. fold_name)
+            name (str): Исходное название
+        """
+        term = self._term(folded)
+        doc_id = len(self._names)
+        self._terms.append(term)
+        self._names.append(name)
+        for gram in trigrams(term):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array("I")
+            postings.append(doc_id)
+
+    def extend(self, entries: Iterable[Tuple[str, str]]) -> None:
+        """Добавляет пары (нормализованное название, исходное название)."""
+        for folded, name in entries:
+            self.add(folded, name)
+
+    def search(self, folded_query: str) -> List[Tuple[int, str]]:
+        """
+        Ищет названия, похожие на запрос.
+
+        Args:
+            folded_query (str): Нормализованный запрос
+
+        Returns:
+            List[Tuple[int, str]]: Пары (расстояние, название) не более
+            FUZZY_CANDIDATES лучших по триграммам кандидатов
+        """
+        query = self._term(folded_query)
+        if len(query) < 2:
+            return []
+
+        grams = trigrams(query)
+        stop_size = max(1, int(len(self._names) * FUZZY_STOP_RATIO))
+        selective = [g for g in grams if len(self._postings.get(g, ())) <= stop_size]
+
+        hits: Counter = Counter()
+        for gram in selective or grams:
+            hits.update(self._postings.get(gram, ()))
+
+        # Допускаем примерно одну ошибку на три символа запроса
+        max_distance = max(1, len(query) // 3)
+        results = []
+        for doc_id, _ in hits.most_common(FUZZY_CANDIDATES):
+            term = self._terms[doc_id]
+            if query in term:
+                distance = 0 if term.startswith(query) else 1
+            else:
+                distance = min(
+                    edit_distance(query, term[: len(query)], max_distance),
+                    edit_distance(query, term, max_distance),
+                )
+            if distance <= max_distance:
+                results.append((distance, self._names[doc_id]))
+
+        return results
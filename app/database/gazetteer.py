@@ -0,0 +1,154 @@
+import csv
+import sys
+from itertools import islice
+from typing import Iterable, Iterator, Optional, TextIO
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.config_db import get_engine
+from app.database.models import City
+from app.logger import logger
+
+# Колонки выгрузки GeoNames (cities*.txt, allCountries.txt), файл без заголовка
+GEONAMES_NAME = 1
+GEONAMES_ASCII_NAME = 2
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_FEATURE_CLASS = 6
+GEONAMES_COUNTRY = 8
+GEONAMES_POPULATION = 14
+GEONAMES_TIMEZONE = 17
+# Класс объекта GeoNames: P - населенные пункты (в allCountries.txt есть еще реки, горы и т.п.)
+GEONAMES_CITY_CLASSES = frozenset({"P"})
+
+CITY_NAME_MAX_LENGTH = City.__table__.c.name.type.length
+
+# Строки GeoNames бывают длиннее стандартного лимита поля csv
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def read_geonames(
+    file: TextIO, ascii_names: bool = False, feature_classes: Iterable[str] = GEONAMES_CITY_CLASSES
+) -> Iterator[dict]:
+    """
+    Построчно читает выгрузку GeoNames в формате TSV.
+
+    Args:
+        file (TextIO): Открытый файл
+        ascii_names (bool): Использовать колонку asciiname вместо name
+        feature_classes (Iterable[str]): Классы объектов, которые загружаются,
+            остальные строки пропускаются
+
+    Yields:
+        dict: Город с ключами name, latitude, longitude, country, timezone, population
+    """
+    name_column = GEONAMES_ASCII_NAME if ascii_names else GEONAMES_NAME
+    feature_classes = frozenset(feature_classes)
+    for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+        if len(row) <= GEONAMES_TIMEZONE or row[GEONAMES_FEATURE_CLASS] not in feature_classes:
+            continue
+        yield {
+            "name": row[name_column],
+            "latitude": _to_float(row[GEONAMES_LATITUDE]),
+            "longitude": _to_float(row[GEONAMES_LONGITUDE]),
+            "country": row[GEONAMES_COUNTRY] or None,
+            "timezone": row[GEONAMES_TIMEZONE] or None,
+            "population": _to_int(row[GEONAMES_POPULATION]),
+        }
+
+
+def read_csv(file: TextIO) -> Iterator[dict]:
+    """
+    Построчно читает CSV с заголовком name,latitude,longitude[,country,timezone,population].
+
+    Args:
+        file (TextIO): Открытый файл
+
+    Yields:
+        dict: Город с ключами name, latitude, longitude, country, timezone, population
+    """
+    for row in csv.DictReader(file):
+        yield {
+            "name": row.get("name", ""),
+            "latitude": _to_float(row.get("latitude")),
+            "longitude": _to_float(row.get("longitude")),
+            "country": row.get("country") or None,
+            "timezone": row.get("timezone") or None,
+            "population": _to_int(row.get("population")),
+        }
+
+
+def _clean(rows: Iterable[dict], min_population: int) -> Iterator[dict]:
+    for row in rows:
+        name = row["name"].strip()
+        if not name or len(name) > CITY_NAME_MAX_LENGTH:
+            continue
+        if row["latitude"] is None or row["longitude"] is None:
+            continue
+        if (row["population"] or 0) < min_population:
+            continue
+        row["name"] = name
+        yield row
+
+
+def import_cities(rows: Iterable[dict], batch_size: int = 5000, min_population: int = 0) -> int:
+    """
+    Загружает города в таблицу cities пакетами, каждый пакет - отдельная транзакция.
+
+    Память ограничена размером пакета, поэтому файл любого размера читается
+    потоково. Для одноименных городов остается самый населенный; уже
+    существующие города (например, найденные пользователями) дополняются
+    координатами и населением.
+
+    Args:
+        rows (Iterable[dict]): Города, см. read_geonames/read_csv
+        batch_size (int): Размер пакета
+        min_population (int): Минимальное население для загрузки
+
+    Returns:
+        int: Количество обработанных строк
+    """
+    stmt = sqlite_insert(City.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[City.name],
+        set_={
+            "latitude": stmt.excluded.latitude,
+            "longitude": stmt.excluded.longitude,
+            "country": stmt.excluded.country,
+            "timezone": stmt.excluded.timezone,
+            "population": stmt.excluded.population,
+        },
+        where=or_(
+            City.__table__.c.population.is_(None),
+            stmt.excluded.population > City.__table__.c.population,
+        ),
+    )
+
+    cleaned = _clean(rows, min_population)
+    total = 0
+    while True:
+        batch = list(islice(cleaned, batch_size))
+        if not batch:
+            break
+        with get_engine().begin() as conn:
+            conn.execute(stmt, batch)
+        total += len(batch)
+        logger.debug("Загружено городов: %s", total)
+
+    logger.info("Импорт справочника городов завершен: %s строк", total)
+    return total
@@ -0,0 +1,114 @@
+import atexit
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.background import PeriodicTask
+from app.database.config_db import get_engine
+from app.database.request_db import bump_search_stats_version, search_event_insert, search_history_upsert
+from app.logger import logger
+
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "1") == "1"
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 5))
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", 100))
+
+
+class SearchHistoryBuffer:
+    """
+    Буфер отложенной записи счетчиков истории поиска и журнала поисков.
+
+    Поиски накапливаются в памяти как (city_id -> прирост счетчика, последнее
+    посещение) и список событий и сбрасываются в БД одной транзакцией по таймеру, при
+    достижении порога или при завершении процесса. Счетчики в БД становятся
+    согласованными с задержкой не более flush_interval.
+    """
+
+    def __init__(self, flush_interval: float, flush_size: int):
+        self.flush_size = flush_size
+        self._pending: dict[int, list] = {}
+        self._events: list[dict] = []
+        self._pending_searches = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task = PeriodicTask("search-history-flush", flush_interval, self.flush)
+
+    def add(self, city_id: int, visited_at: Optional[datetime] = None) -> None:
+        """
+        Учитывает один поиск города.
+
+        Args:
+            city_id (int): ID города
+            visited_at (Optional[datetime]): Время поиска, по умолчанию текущее
+        """
+        visited_at = visited_at or datetime.now(timezone.utc)
+        self._task.start()
+
+        with self._lock:
+            entry = self._pending.get(city_id)
+            if entry is None:
+                self._pending[city_id] = [1, visited_at]
+            else:
+                entry[0] += 1
+                entry[1] = max(entry[1], visited_at)
+            self._events.append({"b_city_id": city_id, "b_searched_at": visited_at})
+            self._pending_searches += 1
+            should_flush = self._pending_searches >= self.flush_size
+
+        if should_flush:
+            self._task.trigger()
+
+    def flush(self) -> int:
+        """
+        Сбрасывает накопленные счетчики в БД одной транзакцией.
+
+        Returns:
+            int: Количество обновленных городов
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                self._pending_searches = 0
+
+            if not pending:
+                return 0
+
+            rows = [
+                {"b_city_id": city_id, "b_count": count, "b_last_visited": last_visited}
+                for city_id, (count, last_visited) in pending.items()
+            ]
+            try:
+                with get_engine().begin() as conn:
+                    conn.execute(search_history_upsert(), rows)
+                    conn.execute(search_event_insert(), events)
+                    bump_search_stats_version(conn)
+            except Exception as e:
+                logger.error("Ошибка при сбросе буфера истории поиска: %s", e)
+                self._restore(pending, events)
+                return 0
+
+            logger.debug("Сброшен буфер истории поиска: %s городов", len(rows))
+            return len(rows)
+
+    def _restore(self, pending: dict[int, list], events: list[dict]) -> None:
+        """Возвращает несохраненные счетчики и события в буфер для следующей попытки."""
+        with self._lock:
+            self._events[:0] = events
+            for city_id, (count, last_visited) in pending.items():
+                entry = self._pending.get(city_id)
+                if entry is None:
+                    self._pending[city_id] = [count, last_visited]
+                else:
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_visited)
+                self._pending_searches += count
+
+    def close(self) -> None:
+        """Останавливает фоновый сброс и записывает остаток буфера."""
+        self._task.stop(timeout=HISTORY_FLUSH_INTERVAL)
+        self.flush()
+
+
+search_history_buffer = SearchHistoryBuffer(HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_SIZE)
+atexit.register(search_history_buffer.close)
@@ -0,0 +1,80 @@
+from sqlalchemy import Connection, Engine, MetaData, inspect, text
+
+from app.logger import logger
+
+
+def migrate_db(engine: Engine, metadata: MetaData) -> None:
+    """
+    Легковесная миграция существующей базы данных.
+
+    create_all() создает только отсутствующие таблицы, поэтому для уже
+    существующих файлов site.db добавляются недостающие nullable-колонки
+    через ALTER TABLE ADD COLUMN и создаются недостающие индексы.
+
+    Args:
+        engine (Engine): Движок SQLAlchemy
+        metadata (MetaData): Метаданные моделей
+    """
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                if not column.nullable:
+                    logger.error(
+                        "Колонку %s.%s нельзя добавить автоматически: NOT NULL", table.name, column.name
+                    )
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                logger.info("Добавлена колонка %s.%s", table.name, column.name)
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+
+                if table.name == "search_history" and "city_id" in index.columns:
+                    _merge_duplicate_search_history(conn)
+
+                index.create(conn)
+                logger.info("Создан индекс %s", index.name)
+
+
+def _merge_duplicate_search_history(conn: Connection) -> None:
+    """
+    Объединяет дублирующиеся записи истории одного города перед созданием
+    уникального индекса по city_id: счетчики суммируются, дата берется последняя.
+    """
+    from app.database.request_db import bump_search_stats_version
+
+    conn.execute(
+        text(
+            """
+            UPDATE search_history
+            SET count = (
+                    SELECT SUM(h.count) FROM search_history h
+                    WHERE h.city_id = search_history.city_id
+                ),
+                last_visited = (
+                    SELECT MAX(h.last_visited) FROM search_history h
+                    WHERE h.city_id = search_history.city_id
+                )
+            WHERE id IN (SELECT MIN(id) FROM search_history GROUP BY city_id HAVING COUNT(*) > 1)
+            """
+        )
+    )
+    result = conn.execute(
+        text("DELETE FROM search_history WHERE id NOT IN (SELECT MIN(id) FROM search_history GROUP BY city_id)")
+    )
+    if result.rowcount:
+        bump_search_stats_version(conn)
+        logger.info("Объединено дублирующихся записей истории поиска: %s", result.rowcount)
@@ -1,7 +1,8 @@
+import os
 from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
 from datetime import datetime, timezone
-from sqlalchemy import Integer, String, DateTime, ForeignKey
-from app.database.config_db import engine
+from sqlalchemy import Integer, String, DateTime, Float, ForeignKey, Index, inspect
+from app.database.config_db import get_engine
 
 
 class Base(DeclarativeBase):
@@ -23,6 +24,11 @@ class City(Base):
         nullable=False,
         comment="Название города",
     )
+    latitude: Mapped[float | None] = mapped_column(Float, nullable=True, comment="Широта")
+    longitude: Mapped[float | None] = mapped_column(Float, nullable=True, comment="Долгота")
+    country: Mapped[str | None] = mapped_column(String(100), nullable=True, comment="Страна")
+    timezone: Mapped[str | None] = mapped_column(String(64), nullable=True, comment="Часовой пояс")
+    population: Mapped[int | None] = mapped_column(Integer, nullable=True, comment="Население")
 
     searches: Mapped[list["SearchHistory"]] = relationship(
         "SearchHistory",
@@ -35,10 +41,17 @@ class SearchHistory(Base):
     """Модель истории поиска городов."""
 
     __tablename__ = "search_history"
+    __table_args__ = (
+        # Сортировка и постраничный вывод статистики (см. get_search_stats_page)
+        Index("ix_search_history_count_city_id", "count", "city_id"),
+        Index("ix_search_history_last_visited_city_id", "last_visited", "city_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     city_id: Mapped[int] = mapped_column(
         ForeignKey("cities.id", ondelete="CASCADE"),
+        unique=True,
+        index=True,
         nullable=False,
         comment="ID города из таблицы cities",
     )
@@ -60,8 +73,122 @@ class SearchHistory(Base):
     city: Mapped["City"] = relationship("City", back_populates="searches")
 
 
+class SearchStatsVersion(Base):
+    """
+    Версия статистики поиска (одна строка).
+
+    Увеличивается в той же транзакции, что и любая запись в search_history,
+    и служит ключом кэша и ETag ответа /api/cities. Время последнего посещения
+    для этого не подходит: отложенная запись из другого воркера добавляет
+    поиски с более ранними датами, не меняя максимума.
+    """
+
+    __tablename__ = "search_stats_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, comment="Номер версии, только растет")
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, comment="Время последнего изменения статистики (UTC)"
+    )
+
+
+class SearchEvent(Base):
+    """
+    Журнал поисков городов (только добавление).
+
+    Записи периодически сворачиваются в почасовые и посуточные агрегаты
+    и удаляются (см. app.database.analytics).
+    """
+
+    __tablename__ = "search_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    city_id: Mapped[int] = mapped_column(
+        ForeignKey("cities.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="ID города из таблицы cities",
+    )
+    searched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        comment="Время поиска (UTC)",
+    )
+
+
+class SearchStatsHourly(Base):
+    """Количество поисков города за час."""
+
+    __tablename__ = "search_stats_hourly"
+    __table_args__ = (Index("ix_search_stats_hourly_bucket_city_id", "bucket", "city_id", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, comment="Начало часа (UTC)")
+    city_id: Mapped[int] = mapped_column(
+        ForeignKey("cities.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="ID города из таблицы cities",
+    )
+    count: Mapped[int] = mapped_column(Integer, nullable=False, comment="Количество поисков за час")
+
+
+class SearchStatsDaily(Base):
+    """Количество поисков города за сутки."""
+
+    __tablename__ = "search_stats_daily"
+    __table_args__ = (Index("ix_search_stats_daily_bucket_city_id", "bucket", "city_id", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    bucket: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, comment="Начало суток (UTC)")
+    city_id: Mapped[int] = mapped_column(
+        ForeignKey("cities.id", ondelete="CASCADE"),
+        nullable=False,
+        comment="ID города из таблицы cities",
+    )
+    count: Mapped[int] = mapped_column(Integer, nullable=False, comment="Количество поисков за сутки")
+
+
 def init_db():
-    """Инициализация базы данных - создание всех таблиц."""
+    """
+    Инициализация базы данных - создание всех таблиц и миграция существующих.
+
+    Выполняется явно командой `flask init-db` до запуска воркеров, а не при
+    импорте: иначе каждый процесс проверял бы схему при старте, а воркеры,
+    стартующие одновременно на новой БД, создавали бы таблицы наперегонки.
+    """
+    from app.database.migrations import migrate_db
+
+    engine = get_engine()
     Base.metadata.create_all(engine)
+    migrate_db(engine, Base.metadata)
+
+
+class DatabaseNotInitializedError(RuntimeError):
+    """В базе данных нет таблиц приложения: не выполнена `flask init-db`."""
+
+    pass
+
+
+_checked_pid: int | None = None
+
+
+def check_db() -> None:
+    """
+    Проверяет, что таблицы приложения созданы. После успешной проверки
+    процесс больше не обращается к схеме.
+
+    Raises:
+        DatabaseNotInitializedError: Если каких-то таблиц нет
+    """
+    global _checked_pid
+
+    if _checked_pid == os.getpid():
+        return
 
-init_db()
+    inspector = inspect(get_engine())
+    missing = [table for table in Base.metadata.tables if not inspector.has_table(table)]
+    if missing:
+        raise DatabaseNotInitializedError(
+            f"В базе данных нет таблиц {', '.join(missing)}: выполните `flask init-db`"
+        )
+    _checked_pid = os.getpid()
@@ -1,9 +1,12 @@
 from datetime import datetime, timezone
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import Connection, Insert, Row, and_, bindparam, func, insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from .models import SearchHistory, City
+from .city_index import city_index
+from .models import SearchEvent, SearchHistory, SearchStatsVersion, City
 
-from app.logger import logger
+from app.logger import hot_logger, logger
 
 
 def get_city_by_name(db: Session, city_name: str) -> Optional[City]:
@@ -17,13 +20,13 @@ def get_city_by_name(db: Session, city_name: str) -> Optional[City]:
     Returns:
         Optional[City]: Объект города или None, если город не найден
     """
-    logger.debug(f"Поиск города по имени: {city_name}")
+    hot_logger.debug("Поиск города по имени: %s", city_name)
     city = db.query(City).filter(City.name == city_name).first()
 
     if not city:
-        logger.debug(f"Город {city_name} не найден в базе")
+        hot_logger.debug("Город %s не найден в базе", city_name)
     else:
-        logger.debug(f"Найден город: {city.name} (ID: {city.id})")
+        hot_logger.debug("Найден город: %s (ID: %s)", city.name, city.id)
 
     return city
 
@@ -42,24 +45,50 @@ def create_city(db: Session, city_name: str) -> City:
     Raises:
         Exception: В случае ошибки при создании города
     """
-    logger.info(f"Создание нового города: {city_name}")
+    logger.info("Создание нового города: %s", city_name)
     try:
         city = City(name=city_name)
         db.add(city)
         db.flush()
         db.commit()
-        logger.info(f"Успешно создан город {city_name} (ID: {city.id})")
+        logger.info("Успешно создан город %s (ID: %s)", city_name, city.id)
         return city
     except Exception as e:
         db.rollback()
-        logger.error(f"Ошибка при создании города {city_name}: {str(e)}")
+        logger.error("Ошибка при создании города %s: %s", city_name, e)
         raise
 
 
+def upsert_city(db: Session, city_name: str) -> int:
+    """
+    Атомарно создает город, если его еще нет, и возвращает его ID.
+
+    Выполняется одним запросом INSERT ... ON CONFLICT(name) ... RETURNING,
+    поэтому одновременные вставки одного города не нарушают уникальность
+    City.name. Транзакцию фиксирует вызывающий код.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_name (str): Название города
+
+    Returns:
+        int: ID существующего или созданного города
+    """
+    stmt = sqlite_insert(City).values(name=city_name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[City.name],
+        set_={"name": stmt.excluded.name},
+    ).returning(City.id)
+    return db.execute(stmt).scalar_one()
+
+
 def get_or_create_city(db: Session, city_name: str) -> City:
     """
     Получает город из базы или создает новый, если он не существует.
 
+    Существующий город читается без блокировки на запись; новый создается
+    через upsert_city, что безопасно при одновременных запросах.
+
     Args:
         db (Session): Сессия базы данных SQLAlchemy
         city_name (str): Название города
@@ -67,16 +96,99 @@ def get_or_create_city(db: Session, city_name: str) -> City:
     Returns:
         City: Существующий или созданный объект города
     """
-    logger.debug(f"Попытка получить или создать город: {city_name}")
+    hot_logger.debug("Попытка получить или создать город: %s", city_name)
     city = get_city_by_name(db, city_name)
 
     if not city:
-        logger.info(f"Город {city_name} не найден, создаем новый")
-        city = create_city(db, city_name)
+        logger.info("Город %s не найден, создаем новый", city_name)
+        try:
+            city_id = upsert_city(db, city_name)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Ошибка при создании города %s: %s", city_name, e)
+            raise
+        city = db.get(City, city_id)
+        city_index.add_city(city_name)
 
     return city
 
 
+def get_city_coords(db: Session, city_name: str) -> Optional[Tuple[float, float]]:
+    """
+    Получает сохраненные координаты города из базы данных.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_name (str): Название города
+
+    Returns:
+        Optional[Tuple[float, float]]: Кортеж (широта, долгота) или None,
+        если город не найден или еще не геокодирован
+    """
+    row = db.query(City.latitude, City.longitude).filter(City.name == city_name).first()
+
+    if row is None or row.latitude is None or row.longitude is None:
+        hot_logger.debug("Координаты города %s отсутствуют в базе", city_name)
+        return None
+
+    return row.latitude, row.longitude
+
+
+def get_cities_coords(db: Session, city_names: List[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Получает сохраненные координаты нескольких городов одним запросом.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_names (List[str]): Названия городов
+
+    Returns:
+        Dict[str, Tuple[float, float]]: Координаты по названию города
+        (только для уже геокодированных городов)
+    """
+    if not city_names:
+        return {}
+
+    rows = (
+        db.query(City.name, City.latitude, City.longitude)
+        .filter(City.name.in_(city_names), City.latitude.is_not(None), City.longitude.is_not(None))
+        .all()
+    )
+    return {row.name: (row.latitude, row.longitude) for row in rows}
+
+
+def update_city_location(db: Session, city_name: str, location: dict) -> None:
+    """
+    Сохраняет результат геокодирования для существующего города.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_name (str): Название города
+        location (dict): Словарь с ключами latitude, longitude, country, timezone
+    """
+    try:
+        updated = (
+            db.query(City)
+            .filter(City.name == city_name)
+            .update(
+                {
+                    City.latitude: location["latitude"],
+                    City.longitude: location["longitude"],
+                    City.country: location.get("country"),
+                    City.timezone: location.get("timezone"),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if updated:
+            logger.debug("Сохранены координаты города %s", city_name)
+    except Exception as e:
+        db.rollback()
+        logger.error("Ошибка при сохранении координат города %s: %s", city_name, e)
+
+
 def get_search_history_by_city_id(db: Session, city_id: int) -> Optional[SearchHistory]:
     """
     Получает историю поиска по ID города.
@@ -88,17 +200,90 @@ def get_search_history_by_city_id(db: Session, city_id: int) -> Optional[SearchH
     Returns:
         Optional[SearchHistory]: Запись истории поиска или None, если не найдена
     """
-    logger.debug(f"Поиск истории для города с ID: {city_id}")
+    hot_logger.debug("Поиск истории для города с ID: %s", city_id)
     history_entry = db.query(SearchHistory).filter(SearchHistory.city_id == city_id).first()
 
     if history_entry:
-        logger.debug(f"Найдена запись истории для города ID {city_id}: {history_entry.count} посещений")
+        hot_logger.debug("Найдена запись истории для города ID %s: %s посещений", city_id, history_entry.count)
     else:
-        logger.debug(f"История для города ID {city_id} не найдена")
+        hot_logger.debug("История для города ID %s не найдена", city_id)
 
     return history_entry
 
 
+def search_history_upsert() -> Insert:
+    """
+    Строит запрос атомарного увеличения счетчика поиска города.
+
+    INSERT ... ON CONFLICT(city_id) DO UPDATE прибавляет count к текущему
+    значению и сохраняет более позднюю дату посещения. Ожидает параметры
+    b_city_id, b_count и b_last_visited; подходит и для executemany.
+
+    Returns:
+        Insert: Запрос SQLAlchemy
+    """
+    stmt = sqlite_insert(SearchHistory).values(
+        city_id=bindparam("b_city_id"),
+        count=bindparam("b_count"),
+        last_visited=bindparam("b_last_visited"),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[SearchHistory.city_id],
+        set_={
+            "count": SearchHistory.count + stmt.excluded.count,
+            "last_visited": func.max(SearchHistory.last_visited, stmt.excluded.last_visited),
+        },
+    )
+
+
+def bump_search_stats_version(db: Session | Connection) -> None:
+    """
+    Увеличивает версию статистики поиска. Вызывается в той же транзакции,
+    что и изменение search_history; транзакцию фиксирует вызывающий код.
+
+    Args:
+        db (Session | Connection): Сессия или соединение SQLAlchemy
+    """
+    stmt = sqlite_insert(SearchStatsVersion).values(id=1, version=1, updated_at=datetime.now(timezone.utc))
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[SearchStatsVersion.id],
+            set_={"version": SearchStatsVersion.version + 1, "updated_at": stmt.excluded.updated_at},
+        )
+    )
+
+
+def search_event_insert() -> Insert:
+    """
+    Строит запрос добавления записи в журнал поисков.
+    Ожидает параметры b_city_id и b_searched_at; подходит и для executemany.
+
+    Returns:
+        Insert: Запрос SQLAlchemy
+    """
+    return insert(SearchEvent).values(
+        city_id=bindparam("b_city_id"),
+        searched_at=bindparam("b_searched_at"),
+    )
+
+
+def increment_search_history(db: Session, city_id: int, count: int = 1) -> None:
+    """
+    Атомарно увеличивает счетчик поиска города одним запросом.
+    Транзакцию фиксирует вызывающий код.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_id (int): ID города
+        count (int): Прирост счетчика
+    """
+    db.execute(
+        search_history_upsert(),
+        {"b_city_id": city_id, "b_count": count, "b_last_visited": datetime.now(timezone.utc)},
+    )
+    bump_search_stats_version(db)
+
+
 def update_or_create_search_history(db: Session, city_id: int) -> SearchHistory:
     """
     Обновляет счетчик посещений для существующей записи истории или создает новую.
@@ -113,26 +298,45 @@ def update_or_create_search_history(db: Session, city_id: int) -> SearchHistory:
     Raises:
         Exception: В случае ошибки при обновлении/создании записи
     """
-    logger.info(f"Обновление истории поиска для города ID: {city_id}")
+    hot_logger.info("Обновление истории поиска для города ID: %s", city_id)
     try:
-        history_entry = get_search_history_by_city_id(db, city_id)
+        increment_search_history(db, city_id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Ошибка при обновлении истории поиска для города ID %s: %s", city_id, e)
+        raise
 
-        if history_entry:
-            history_entry.count += 1
-            history_entry.last_visited = datetime.now(timezone.utc)
-            logger.debug(f"Обновлена запись истории: теперь {history_entry.count} посещений")
-        else:
-            history_entry = SearchHistory(city_id=city_id, last_visited=datetime.now(timezone.utc), count=1)
-            db.add(history_entry)
-            logger.debug("Создана новая запись истории поиска")
+    return get_search_history_by_city_id(db, city_id)
 
+
+def record_city_search(db: Session, city_name: str) -> int:
+    """
+    Учитывает поиск города: создает город при необходимости, увеличивает
+    счетчик и пишет событие в журнал поисков в одной транзакции с одним коммитом.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        city_name (str): Название города
+
+    Returns:
+        int: ID города
+    """
+    try:
+        city = get_city_by_name(db, city_name)
+        city_id = city.id if city else upsert_city(db, city_name)
+        increment_search_history(db, city_id)
+        db.execute(search_event_insert(), {"b_city_id": city_id, "b_searched_at": datetime.now(timezone.utc)})
         db.commit()
-        return history_entry
     except Exception as e:
         db.rollback()
-        logger.error(f"Ошибка при обновлении истории поиска для города ID {city_id}: {str(e)}")
+        logger.error("Ошибка при сохранении поиска города %s: %s", city_name, e)
         raise
 
+    if city is None:
+        city_index.add_city(city_name)
+    return city_id
+
 
 def get_all_search_stats(db: Session) -> List[Tuple[str, int, datetime]]:
     """
@@ -153,7 +357,104 @@ def get_all_search_stats(db: Session) -> List[Tuple[str, int, datetime]]:
         .join(SearchHistory, City.id == SearchHistory.city_id)
         .all()
     )
-    logger.debug(f"Получено {len(stats)} записей статистики")
+    logger.debug("Получено %s записей статистики", len(stats))
+    return stats
+
+
+def iter_search_stats(db: Session, batch_size: int = 1000) -> Iterator[Row]:
+    """
+    Потоково перебирает статистику поиска по всем городам.
+
+    Строки читаются с курсора пакетами по batch_size (yield_per), поэтому
+    расход памяти не зависит от размера таблицы. Сессия должна оставаться
+    открытой, пока итератор не исчерпан.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        batch_size (int): Размер пакета, читаемого с курсора
+
+    Yields:
+        Row: Строки (name, count, last_visited) в порядке city_id
+    """
+    stmt = (
+        select(City.name, SearchHistory.count, SearchHistory.last_visited)
+        .join(SearchHistory, City.id == SearchHistory.city_id)
+        .order_by(SearchHistory.city_id)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.execute(stmt)
+
+
+STATS_SORT_COLUMNS = {
+    "count": SearchHistory.count,
+    "last_visited": SearchHistory.last_visited,
+}
+
+
+def get_search_stats_version(db: Session) -> Tuple[int, Optional[datetime]]:
+    """
+    Возвращает версию статистики поиска и время ее последнего изменения.
+
+    Версия увеличивается при каждой записи истории (см. bump_search_stats_version),
+    поэтому служит ключом кэша ответов статистики.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+
+    Returns:
+        Tuple[int, Optional[datetime]]: Версия (0, если истории нет) и время изменения (UTC)
+    """
+    row = db.execute(select(SearchStatsVersion.version, SearchStatsVersion.updated_at)).first()
+    if row is None:
+        return 0, None
+    version, updated_at = row
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return version, updated_at
+
+
+def get_search_stats_page(
+    db: Session,
+    sort: str = "count",
+    limit: int = 100,
+    offset: int = 0,
+    after: Optional[Tuple[object, int]] = None,
+) -> List[Tuple[str, int, datetime, int]]:
+    """
+    Получает страницу статистики поиска, отсортированную по убыванию.
+
+    Поддерживает как offset, так и keyset-пагинацию: after - значение
+    сортируемой колонки и ID города последней строки предыдущей страницы.
+    Keyset-пагинация использует индекс и не замедляется на дальних страницах.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        sort (str): Колонка сортировки: count или last_visited
+        limit (int): Размер страницы
+        offset (int): Смещение (игнорируется, если задан after)
+        after (Optional[Tuple[object, int]]): Курсор (значение, city_id)
+
+    Returns:
+        List[Tuple[str, int, datetime, int]]: Кортежи (название города,
+        количество посещений, дата последнего посещения, ID города)
+    """
+    column = STATS_SORT_COLUMNS[sort]
+    query = db.query(City.name, SearchHistory.count, SearchHistory.last_visited, SearchHistory.city_id).join(
+        SearchHistory, City.id == SearchHistory.city_id
+    )
+
+    if after is not None:
+        value, city_id = after
+        query = query.filter(
+            or_(column < value, and_(column == value, SearchHistory.city_id < city_id))
+        )
+
+    query = query.order_by(column.desc(), SearchHistory.city_id.desc())
+    if after is None and offset:
+        query = query.offset(offset)
+
+    stats = query.limit(limit).all()
+    logger.debug("Получено %s записей статистики (sort=%s)", len(stats), sort)
     return stats
 
 
@@ -161,22 +462,51 @@ def get_cities_by_prefix(db: Session, prefix: str, limit: int = 5) -> List[str]:
     """
     Получает список городов, названия которых начинаются с заданного префикса.
 
+    Поиск выполняется по индексу в памяти процесса (см. city_index) без учета
+    регистра; к БД индекс обращается только при первой загрузке.
+
     Args:
         db (Session): Сессия базы данных SQLAlchemy
         prefix (str): Префикс для поиска городов
         limit (int): Максимальное количество возвращаемых результатов
 
     Returns:
-        List[str]: Список названий городов, соответствующих префиксу
+        List[str]: Список названий городов, соответствующих префиксу,
+        самые популярные первыми
     """
-    logger.debug(f"Поиск городов по префиксу: '{prefix}' (лимит: {limit})")
+    hot_logger.debug("Поиск городов по префиксу: '%s' (лимит: %s)", prefix, limit)
 
     if not prefix:
-        logger.debug("Пустой префикс, возвращаем пустой список")
+        hot_logger.debug("Пустой префикс, возвращаем пустой список")
+        return []
+
+    city_index.ensure_loaded(db)
+    cities = city_index.search(prefix, limit)
+
+    hot_logger.debug("Найдено %s городов по префиксу '%s'", len(cities), prefix)
+    return cities
+
+
+def get_cities_fuzzy(db: Session, query: str, limit: int = 5) -> List[str]:
+    """
+    Нечеткий поиск городов: опечатки, совпадения с середины названия
+    и латинские написания кириллических названий.
+
+    Args:
+        db (Session): Сессия базы данных SQLAlchemy
+        query (str): Строка поиска
+        limit (int): Максимальное количество возвращаемых результатов
+
+    Returns:
+        List[str]: Список названий городов, самые похожие первыми
+    """
+    hot_logger.debug("Нечеткий поиск городов: '%s' (лимит: %s)", query, limit)
+
+    if not query:
         return []
 
-    results = db.query(City.name).filter(City.name.ilike(f"{prefix}%")).limit(limit).all()
-    cities = [row.name for row in results]
+    city_index.ensure_loaded(db)
+    cities = city_index.fuzzy_search(query, limit)
 
-    logger.debug(f"Найдено {len(cities)} городов по префиксу '{prefix}'")
+    hot_logger.debug("Найдено %s городов по запросу '%s'", len(cities), query)
     return cities
@@ -0,0 +1,134 @@
+import math
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+HOURLY_TIME_FORMAT = "%Y-%m-%dT%H:%M"
+DAILY_TIME_FORMAT = "%Y-%m-%d"
+
+
+class ForecastSeries:
+    """
+    Временной ряд прогноза в колоночном виде.
+
+    Open-Meteo возвращает почасовой и посуточный прогноз параллельными
+    массивами; они и хранятся параллельными компактными массивами: время -
+    int64 (unixtime), значения - float32, пропуски - NaN. Это 4 байта на
+    значение вместо словаря на каждый час, а срез по времени находится
+    двоичным поиском и разворачивается только в запрошенных точках.
+    """
+
+    __slots__ = ("times", "columns", "utc_offset", "time_format")
+
+    def __init__(
+        self,
+        times: array,
+        columns: dict[str, array],
+        utc_offset: int = 0,
+        time_format: str = HOURLY_TIME_FORMAT,
+    ):
+        self.times = times
+        self.columns = columns
+        self.utc_offset = utc_offset
+        self.time_format = time_format
+
+    @classmethod
+    def from_response(cls, block: dict, utc_offset: int, time_format: str) -> "ForecastSeries":
+        """
+        Строит ряд из блока hourly/daily ответа Open-Meteo (timeformat=unixtime).
+
+        Raises:
+            ValueError: Если длины массивов не совпадают
+        """
+        times = array("q", block["time"])
+        columns = {}
+        for name, values in block.items():
+            if name == "time":
+                continue
+            column = array("f", (math.nan if value is None else value for value in values))
+            if len(column) != len(times):
+                raise ValueError(f"Длина {name} ({len(column)}) не совпадает с длиной time ({len(times)})")
+            columns[name] = column
+        return cls(times, columns, utc_offset, time_format)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def to_json(self) -> dict:
+        """Представление для JSON (общие кэши хранят значения в JSON)."""
+        return {
+            "times": self.times.tolist(),
+            "columns": {name: column.tolist() for name, column in self.columns.items()},
+            "utc_offset": self.utc_offset,
+            "time_format": self.time_format,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ForecastSeries":
+        return cls(
+            array("q", data["times"]),
+            {name: array("f", values) for name, values in data["columns"].items()},
+            data["utc_offset"],
+            data["time_format"],
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Размер данных ряда в байтах (без накладных расходов объектов)."""
+        return sum(column.itemsize * len(column) for column in (self.times, *self.columns.values()))
+
+    def slice(self, start: float, count: int) -> dict:
+        """
+        Срез ряда из не более count точек, начиная с точки, в которую попадает start.
+
+        Args:
+            start (float): Момент времени (unixtime), например текущее время
+            count (int): Количество точек
+
+        Returns:
+            dict: {"time": [локальное время строкой, ...], параметр: [значение или None, ...]}
+        """
+        begin = max(0, bisect_right(self.times, start) - 1)
+        end = min(len(self.times), begin + count)
+        result = {
+            "time": [
+                datetime.fromtimestamp(t + self.utc_offset, timezone.utc).strftime(self.time_format)
+                for t in self.times[begin:end]
+            ]
+        }
+        for name, column in self.columns.items():
+            result[name] = [None if math.isnan(value) else round(value, 2) for value in column[begin:end]]
+        return result
+
+
+class ExtendedForecast(NamedTuple):
+    """Почасовой и посуточный прогноз для одной точки."""
+
+    hourly: ForecastSeries
+    daily: ForecastSeries
+
+    @classmethod
+    def from_response(cls, response: dict) -> "ExtendedForecast":
+        """
+        Разбирает ответ Open-Meteo с блоками hourly и daily.
+
+        Raises:
+            KeyError, TypeError, ValueError: Если ответ неполный или некорректный
+        """
+        utc_offset = int(response.get("utc_offset_seconds") or 0)
+        return cls(
+            ForecastSeries.from_response(response["hourly"], utc_offset, HOURLY_TIME_FORMAT),
+            ForecastSeries.from_response(response["daily"], utc_offset, DAILY_TIME_FORMAT),
+        )
+
+    def to_json(self) -> dict:
+        return {"hourly": self.hourly.to_json(), "daily": self.daily.to_json()}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ExtendedForecast":
+        return cls(ForecastSeries.from_json(data["hourly"]), ForecastSeries.from_json(data["daily"]))
+
+    @property
+    def nbytes(self) -> int:
+        return self.hourly.nbytes + self.daily.nbytes
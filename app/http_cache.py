@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional
+
+from flask import Response, request
+
+
+def make_etag(*parts: object) -> str:
+    """Строит ETag из значений, от которых зависит ответ."""
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional_response(
+    body: bytes,
+    max_age: int,
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+    mimetype: str = "application/json",
+) -> Response:
+    """
+    Формирует ответ с заголовками кэширования и обработкой условных запросов.
+
+    Если If-None-Match / If-Modified-Since запроса совпадают с ETag /
+    Last-Modified ответа, возвращается 304 без тела.
+
+    Args:
+        body (bytes): Тело ответа
+        max_age (int): Cache-Control: max-age в секундах
+        etag (Optional[str]): ETag; если не задан, вычисляется по телу
+        last_modified (Optional[datetime]): Время изменения данных
+        mimetype (str): Тип содержимого
+
+    Returns:
+        Response: Ответ 200 или 304
+    """
+    response = Response(body, mimetype=mimetype)
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+
+def encode_cursor(*values: object) -> str:
+    """Кодирует курсор пагинации в непрозрачную строку."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Декодирует курсор пагинации.
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError("Некорректный курсор") from e
+    if not isinstance(values, list):
+        raise ValueError("Некорректный курсор")
+    return values
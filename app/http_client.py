@@ -0,0 +1,385 @@
+import asyncio
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+if TYPE_CHECKING:
+    # Синхронный клиент нужен только фоновым задачам и пакетным запросам,
+    # поэтому requests импортируется при первом использовании
+    import requests
+
+from app.logger import logger, record_timing
+from app.metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 20))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 3.05))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", 5))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", 2))
+API_BACKOFF_BASE = float(os.getenv("API_BACKOFF_BASE", 0.2))
+API_BACKOFF_MAX = float(os.getenv("API_BACKOFF_MAX", 2))
+# Общий срок запроса со всеми повторами и паузами между ними
+API_TOTAL_TIMEOUT = float(os.getenv("API_TOTAL_TIMEOUT", 8))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", 30))
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class UpstreamError(Exception):
+    """Ошибка обращения к внешнему API."""
+
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    """Запрос отклонен: внешний API считается недоступным."""
+
+    pass
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для внешнего API.
+
+    После failure_threshold подряд неудачных запросов переходит в состояние
+    "open" и отклоняет запросы без обращения к сети. Через recovery_timeout
+    пропускает один пробный запрос ("half_open"): успех закрывает цепь,
+    неудача снова открывает ее.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Проверяет, можно ли выполнить запрос."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("Цепь %s разомкнута после %s ошибок", self.name, self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+_session: Optional["requests.Session"] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+_breakers: dict[str, CircuitBreaker] = {}
+_ssl_context: Optional[ssl.SSLContext] = None
+_async_clients_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_session() -> "requests.Session":
+    """
+    Возвращает общую для процесса сессию с пулом keep-alive соединений.
+
+    Сессия пересоздается после fork, чтобы воркеры gunicorn
+    не делили сокеты родительского процесса.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session, _session_pid = session, pid
+    return _session
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Возвращает автоматический выключатель для хоста из URL."""
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _session_lock:
+            breaker = _breakers.setdefault(
+                host,
+                CircuitBreaker(host, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT),
+            )
+    return breaker
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Вычисляет задержку перед повтором с полным случайным разбросом.
+
+    Args:
+        attempt (int): Номер повтора, начиная с 0
+        retry_after (Optional[str]): Значение заголовка Retry-After
+
+    Returns:
+        Optional[float]: Задержка в секундах или None, если ждать дольше
+        API_BACKOFF_MAX не имеет смысла
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            delay = API_BACKOFF_MAX
+        return delay if delay <= API_BACKOFF_MAX else None
+
+    return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2**attempt))
+
+
+def attempt_timeout(deadline: float) -> Optional[tuple[float, float]]:
+    """
+    Таймауты (соединение, чтение) очередной попытки, урезанные до общего срока.
+
+    Args:
+        deadline (float): Срок по time.monotonic()
+
+    Returns:
+        Optional[tuple[float, float]]: Таймауты или None, если срок истек
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return None
+    return min(API_CONNECT_TIMEOUT, remaining), min(API_READ_TIMEOUT, remaining)
+
+
+def _error_reason(error: Exception) -> str:
+    """Причина неудачной попытки для метрики upstream_errors_total."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"http_{response.status_code}"
+    # Пока requests не импортирован, его исключений возникнуть не могло
+    requests = sys.modules.get("requests")
+    if isinstance(error, httpx.TimeoutException) or (requests and isinstance(error, requests.Timeout)):
+        return "timeout"
+    if isinstance(error, httpx.TransportError) or (requests and isinstance(error, requests.ConnectionError)):
+        return "connection"
+    return "invalid_response"
+
+
+def fetch_json(url: str, endpoint: str = "other") -> dict:
+    """
+    Выполняет GET-запрос к внешнему API с повторами и автоматическим выключателем.
+
+    Повторяет запрос при ошибках соединения, таймаутах и статусах 429/5xx,
+    пока не истечет общий срок API_TOTAL_TIMEOUT: таймауты последней попытки
+    урезаются до оставшегося времени.
+
+    Args:
+        url (str): Адрес запроса
+        endpoint (str): Название API для метрик (geocode, forecast)
+
+    Returns:
+        dict: Декодированный JSON-ответ
+
+    Raises:
+        CircuitOpenError: Если внешний API помечен как недоступный
+        UpstreamError: Если запрос не удался после всех повторов
+    """
+    import requests
+
+    breaker = get_breaker(url)
+    if not breaker.allow_request():
+        UPSTREAM_ERRORS.labels(endpoint, "circuit_open").inc()
+        raise CircuitOpenError(f"Внешний API {breaker.name} временно недоступен")
+
+    session = get_session()
+    last_error: Optional[Exception] = None
+    deadline = time.monotonic() + API_TOTAL_TIMEOUT
+
+    for attempt in range(API_MAX_RETRIES + 1):
+        timeout = attempt_timeout(deadline)
+        if timeout is None:
+            break
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                data = response.json()
+                breaker.record_success()
+                return data
+
+            retry_after = response.headers.get("Retry-After")
+            last_error = requests.HTTPError(f"{response.status_code} для {url}", response=response)
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(last_error)).inc()
+        except requests.HTTPError as e:
+            # 4xx кроме 429 - ошибка запроса, а не признак недоступности API
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(e)).inc()
+            breaker.record_success()
+            raise UpstreamError(str(e)) from e
+        except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+            last_error = e
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(e)).inc()
+        finally:
+            elapsed = time.perf_counter() - started
+            UPSTREAM_LATENCY.labels(endpoint).observe(elapsed)
+            record_timing("upstream", elapsed)
+
+        if attempt == API_MAX_RETRIES:
+            break
+
+        delay = backoff_delay(attempt, retry_after)
+        if delay is None or time.monotonic() + delay >= deadline:
+            break
+        logger.warning("Повтор запроса к %s через %.2f с: %s", breaker.name, delay, last_error)
+        time.sleep(delay)
+
+    breaker.record_failure()
+    raise UpstreamError(str(last_error)) from last_error
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """
+    Возвращает общий для процесса SSL-контекст.
+
+    Загрузка сертификатов занимает десятки миллисекунд, поэтому контекст
+    создается один раз, а не для каждого асинхронного клиента.
+    """
+    global _ssl_context
+
+    if _ssl_context is None:
+        with _session_lock:
+            if _ssl_context is None:
+                _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """
+    Создает асинхронный HTTP-клиент с теми же лимитами пула и таймаутами.
+
+    Клиент привязан к циклу событий, в котором используется; для запросов
+    из представлений используйте get_async_client().
+    """
+    return httpx.AsyncClient(
+        verify=get_ssl_context(),
+        timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_MAXSIZE,
+            max_keepalive_connections=HTTP_POOL_CONNECTIONS,
+        ),
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Возвращает асинхронный клиент текущего цикла событий с пулом keep-alive
+    соединений, общий для всех запросов, выполняемых в этом цикле.
+
+    Циклы событий потоков постоянные (см. app.background.run_in_thread_loop),
+    поэтому соединения с Open-Meteo переиспользуются между запросами.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Цикл событий выполняется в одном потоке, так что клиент для него
+        # создается один раз; блокировка защищает только сам словарь
+        client = create_async_client()
+        with _async_clients_lock:
+            _async_clients[loop] = client
+    return client
+
+
+async def async_fetch_json(client: httpx.AsyncClient, url: str, endpoint: str = "other") -> dict:
+    """
+    Асинхронный аналог fetch_json: те же повторы и автоматический выключатель.
+
+    Args:
+        client (httpx.AsyncClient): Асинхронный HTTP-клиент
+        url (str): Адрес запроса
+        endpoint (str): Название API для метрик (geocode, forecast)
+
+    Returns:
+        dict: Декодированный JSON-ответ
+
+    Raises:
+        CircuitOpenError: Если внешний API помечен как недоступный
+        UpstreamError: Если запрос не удался после всех повторов
+    """
+    breaker = get_breaker(url)
+    if not breaker.allow_request():
+        UPSTREAM_ERRORS.labels(endpoint, "circuit_open").inc()
+        raise CircuitOpenError(f"Внешний API {breaker.name} временно недоступен")
+
+    last_error: Optional[Exception] = None
+    deadline = time.monotonic() + API_TOTAL_TIMEOUT
+
+    for attempt in range(API_MAX_RETRIES + 1):
+        timeout = attempt_timeout(deadline)
+        if timeout is None:
+            break
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            connect_timeout, read_timeout = timeout
+            response = await client.get(url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                data = response.json()
+                breaker.record_success()
+                return data
+
+            retry_after = response.headers.get("Retry-After")
+            last_error = httpx.HTTPStatusError(
+                f"{response.status_code} для {url}", request=response.request, response=response
+            )
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(last_error)).inc()
+        except httpx.HTTPStatusError as e:
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(e)).inc()
+            breaker.record_success()
+            raise UpstreamError(str(e)) from e
+        except (httpx.TransportError, ValueError) as e:
+            last_error = e
+            UPSTREAM_ERRORS.labels(endpoint, _error_reason(e)).inc()
+        finally:
+            elapsed = time.perf_counter() - started
+            UPSTREAM_LATENCY.labels(endpoint).observe(elapsed)
+            record_timing("upstream", elapsed)
+
+        if attempt == API_MAX_RETRIES:
+            break
+
+        delay = backoff_delay(attempt, retry_after)
+        if delay is None or time.monotonic() + delay >= deadline:
+            break
+        logger.warning("Повтор запроса к %s через %.2f с: %s", breaker.name, delay, last_error)
+        await asyncio.sleep(delay)
+
+    breaker.record_failure()
+    raise UpstreamError(str(last_error)) from last_error
@@ -1,10 +1,201 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import re
+import threading
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
+from flask import g, has_app_context
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text - строки для чтения глазами, json - по объекту на строку для сборщиков логов
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Доля записываемых событий горячих путей (автодополнение, запись поиска);
+# предупреждения и ошибки пишутся всегда
+LOG_HOT_SAMPLE_RATE = float(os.getenv("LOG_HOT_SAMPLE_RATE", 0.01))
+# Доля записываемых итогов успешных запросов и отказов 429; остальные ошибки
+# и медленные запросы пишутся всегда
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", 1.0))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", 1000))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Стандартные атрибуты LogRecord; остальные (переданные через extra) попадают в JSON
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Идентификатор запроса: из заголовка X-Request-ID, если он корректен, иначе новый."""
+    if incoming and _REQUEST_ID_PATTERN.fullmatch(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestContextFilter(logging.Filter):
+    """Добавляет к записи идентификатор текущего запроса ("-" вне запроса)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = g.get("request_id", "-") if has_app_context() else "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING; предупреждения и ошибки - всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись в виде одной строки JSON со всеми полями из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        data.update((name, value) for name, value in record.__dict__.items() if name not in _RECORD_ATTRS)
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ProcessQueueHandler(QueueHandler):
+    """
+    Складывает записи в очередь, а в поток вывода их пишет QueueListener
+    в отдельном потоке: обработчики запросов не ждут ввода-вывода.
+
+    Поток слушателя не переживает fork (воркеры gunicorn с preload_app),
+    поэтому в каждом процессе очередь и слушатель создаются заново при
+    первой записи.
+    """
+
+    def __init__(self, *handlers: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.target_handlers = handlers
+        self._listener: Optional[QueueListener] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.queue = queue.SimpleQueue()
+        self._listener = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._stopped:
+            # Завершение процесса: новых потоков уже не создать, пишем сразу
+            for handler in self.target_handlers:
+                handler.handle(record)
+            return
+        if self._listener is None:
+            with self._start_lock:
+                if self._listener is None:
+                    listener = QueueListener(self.queue, *self.target_handlers, respect_handler_level=True)
+                    listener.start()
+                    self._listener = listener
+        super().enqueue(record)
+
+    def stop(self) -> None:
+        """Дописывает оставшиеся записи и останавливает слушателя."""
+        self._stopped = True
+        if self._listener is not None:
+            self._listener.stop()
+
+
+def _configure_logging() -> None:
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+    handler = ProcessQueueHandler(stream)
+    handler.addFilter(RequestContextFilter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    atexit.register(handler.stop)
+
+    # httpx пишет INFO на каждый запрос к Open-Meteo; итог запроса содержит их число и время
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+_configure_logging()
 
 logger = logging.getLogger("APP Weather")
+
+# События, которые происходят на каждом запросе (нажатие клавиши в автодополнении,
+# запись поиска), пишутся выборочно
+hot_logger = logging.getLogger("APP Weather.hot")
+hot_logger.addFilter(SamplingFilter(LOG_HOT_SAMPLE_RATE))
+
+request_logger = logging.getLogger("APP Weather.request")
+_timings_lock = threading.Lock()
+
+
+def record_timing(kind: str, seconds: float) -> None:
+    """Добавляет длительность операции (db, upstream) к итогам текущего запроса."""
+    if not has_app_context():
+        return
+    # Запрос может обращаться к Open-Meteo из нескольких потоков (пакетное геокодирование)
+    with _timings_lock:
+        timings = g.setdefault("timings", {})
+        count, total = timings.get(kind, (0, 0.0))
+        timings[kind] = (count + 1, total + seconds)
+
+
+def log_request(method: str, path: str, route: str, status: int, duration: float) -> None:
+    """
+    Пишет итог запроса одной строкой: статус, время и сколько из него заняли БД и Open-Meteo.
+
+    Успешные быстрые запросы и отказы 429 (при наплыве их особенно много)
+    пишутся с долей LOG_REQUEST_SAMPLE_RATE.
+    """
+    duration_ms = duration * 1000
+    sampled = (status < 400 or status == 429) and duration_ms < LOG_SLOW_REQUEST_MS
+    if sampled and random.random() >= LOG_REQUEST_SAMPLE_RATE:
+        return
+
+    timings = g.get("timings", {})
+    db_count, db_time = timings.get("db", (0, 0.0))
+    upstream_count, upstream_time = timings.get("upstream", (0, 0.0))
+    request_logger.info(
+        "%s %s %s %.1f мс (БД: %s за %.1f мс, Open-Meteo: %s за %.1f мс)",
+        method,
+        path,
+        status,
+        duration_ms,
+        db_count,
+        db_time * 1000,
+        upstream_count,
+        upstream_time * 1000,
+        extra={
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "db_queries": db_count,
+            "db_ms": round(db_time * 1000, 2),
+            "upstream_calls": upstream_count,
+            "upstream_ms": round(upstream_time * 1000, 2),
+        },
+    )
@@ -0,0 +1,86 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Если задан каталог, каждый воркер gunicorn пишет метрики в свои файлы,
+# а /metrics суммирует их по всем процессам (см. gunicorn.conf.py)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+# Границы корзин гистограмм, сек: от быстрых запросов к кэшу до таймаутов API
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Запросы, обрабатываемые в данный момент",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Время одной попытки запроса к Open-Meteo",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total",
+    "Неудачные попытки запросов к Open-Meteo",
+    ["endpoint", "reason"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание соединения из пула SQLAlchemy",
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "rate_limited_total",
+    "Запросы, отклоненные ответом 429 из-за лимита частоты",
+    ["route"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Обращения к кэшам в памяти",
+    ["cache", "result"],
+)
+
+
+def statement_type(statement: str) -> str:
+    """Тип SQL-запроса для метки метрики: SELECT, INSERT, UPDATE, DELETE или OTHER."""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Текущие значения метрик в текстовом формате Prometheus.
+
+    Returns:
+        tuple[bytes, str]: Тело ответа и Content-Type
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
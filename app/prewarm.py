@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: выбор ведущего воркера недоступен
+    fcntl = None
+
+from app.api import BATCH_MAX_CITIES, extended_ttl_left, forecast_ttl_left, refresh_weather_by_coords
+from app.background import PeriodicTask
+from app.cache import CACHE_BACKEND
+from app.database.config_db import Session
+from app.database.request_db import get_cities_coords, get_search_stats_page
+from app.logger import logger
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_TOP_N = int(os.getenv("PREWARM_TOP_N", 100))
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", 300))
+# Случайная задержка перед каждым прогревом, доля от интервала
+PREWARM_JITTER = float(os.getenv("PREWARM_JITTER", 0.1))
+# Сколько пакетных запросов к Open-Meteo выполнять одновременно
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", 2))
+# Прогревать кэш только в одном воркере, выбранном по файловой блокировке.
+# Действует только для общего кэша (sqlite, redis): кэш в памяти у каждого
+# воркера свой, и прогревать его должен каждый воркер
+PREWARM_ELECTION = os.getenv("PREWARM_ELECTION", "1") == "1" and CACHE_BACKEND != "memory"
+PREWARM_LOCK_FILE = os.getenv("PREWARM_LOCK_FILE") or os.path.join(tempfile.gettempdir(), "weather-prewarm.lock")
+# Запас на время самого прогрева и ответа Open-Meteo, сек
+PREWARM_MARGIN = 30
+
+
+class ForecastPrewarmer:
+    """
+    Фоновое обновление прогнозов для самых искомых городов.
+
+    Раз в interval секунд (плюс случайная задержка до jitter * interval)
+    берет top_n городов по SearchHistory.count и заново запрашивает текущую
+    погоду и расширенный прогноз для точек, у которых что-то из них истечет
+    до следующего запуска. Точки запрашиваются пакетами по BATCH_MAX_CITIES
+    (оба прогноза одним запросом), не более concurrency пакетов одновременно.
+
+    Если задан lock_file (только при общем кэше), прогрев выполняет только
+    воркер, удерживающий блокировку файла; если он завершится, блокировку
+    при следующем запуске займет другой воркер.
+    """
+
+    def __init__(
+        self,
+        top_n: int,
+        interval: float,
+        jitter: float,
+        concurrency: int,
+        lock_file: Optional[str] = None,
+    ):
+        self.top_n = top_n
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.lock_file = lock_file if fcntl is not None else None
+        self._lock_handle: Optional[IO] = None
+        self._leader_pid: Optional[int] = None
+        self._started_pid: Optional[int] = None
+        self._task = PeriodicTask("forecast-prewarm", interval, self.run)
+
+    def start(self) -> None:
+        """Запускает прогрев в текущем процессе; первый прогрев выполняется сразу."""
+        if self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        self._task.start()
+        self._task.trigger()
+
+    def _is_leader(self) -> bool:
+        """Пытается занять блокировку ведущего воркера без ожидания."""
+        if self.lock_file is None or self._leader_pid == os.getpid():
+            return True
+
+        handle = open(self.lock_file, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+
+        self._lock_handle = handle
+        self._leader_pid = os.getpid()
+        logger.info("Процесс %s выбран для прогрева кэша прогнозов", self._leader_pid)
+        return True
+
+    def run(self) -> int:
+        """
+        Выполняет один прогрев.
+
+        Returns:
+            int: Количество точек, для которых получен прогноз
+        """
+        if self.jitter > 0:
+            time.sleep(random.uniform(0, self.interval * self.jitter))
+        if not self._is_leader():
+            return 0
+
+        db = Session()
+        try:
+            top = get_search_stats_page(db, sort="count", limit=self.top_n)
+            coords = get_cities_coords(db, [row.name for row in top])
+        finally:
+            db.close()
+
+        horizon = self.interval * (1 + self.jitter) + PREWARM_MARGIN
+        due = list({c for c in coords.values() if min(forecast_ttl_left(*c), extended_ttl_left(*c)) <= horizon})
+        if not due:
+            return 0
+
+        batches = [due[i : i + BATCH_MAX_CITIES] for i in range(0, len(due), BATCH_MAX_CITIES)]
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(batches)))) as executor:
+            results = list(executor.map(refresh_weather_by_coords, batches))
+
+        refreshed = sum(1 for batch in results for ok in batch.values() if ok)
+        logger.info("Прогрев кэша прогнозов: получено %s из %s точек", refreshed, len(due))
+        return refreshed
+
+
+forecast_prewarmer = ForecastPrewarmer(
+    PREWARM_TOP_N,
+    PREWARM_INTERVAL,
+    PREWARM_JITTER,
+    PREWARM_CONCURRENCY,
+    lock_file=PREWARM_LOCK_FILE if PREWARM_ELECTION else None,
+)
@@ -0,0 +1,172 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Лимиты в формате "запросов в секунду/запас": запас - сколько запросов
+# подряд можно сделать сразу, дальше - не чаще указанной частоты
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "10/30")
+# Маршруты, которые могут обращаться к Open-Meteo
+RATE_LIMIT_UPSTREAM = os.getenv("RATE_LIMIT_UPSTREAM", "1/10")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 10000))
+# Сколько доверенных прокси стоит перед приложением: адрес клиента берется из
+# X-Forwarded-For на столько позиций справа (левые значения задает сам клиент); 0 - не доверять
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", 0))
+
+# Бюджет обращений к Open-Meteo на процесс: каждый воркер gunicorn считает
+# его отдельно, так что предел хоста в число воркеров раз больше; 0 - без ограничения
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", 8))
+UPSTREAM_QPS = float(os.getenv("UPSTREAM_QPS", 5))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", 20))
+
+# Главная страница (и форма поиска) к Open-Meteo не обращается, она получает RATE_LIMIT_DEFAULT
+UPSTREAM_ROUTES = frozenset({"/weather/<city>", "/api/forecast/<city>", "/api/weather"})
+EXEMPT_ROUTES = frozenset({"/metrics", "/static/<path:filename>"})
+
+
+def parse_limit(value: str) -> tuple[float, int]:
+    """
+    Разбирает лимит вида "2/10" (запросов в секунду/запас).
+
+    Raises:
+        ValueError: Если строка не в этом формате
+    """
+    rate, _, burst = value.partition("/")
+    return float(rate), int(burst or max(1, math.ceil(float(rate))))
+
+
+class TokenBucket:
+    """
+    Маркерная корзина: пополняется со скоростью rate маркеров в секунду
+    до burst, каждый запрос забирает один маркер. Время now (по
+    time.monotonic() или часам владельца) передает владелец корзины.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = now
+
+    def _refill(self, now: float) -> None:
+        # now может отставать от updated_at, если его получили до блокировки
+        if now > self.updated_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def available(self, now: float) -> int:
+        """Сколько маркеров можно забрать сейчас. Вызывается под блокировкой владельца."""
+        self._refill(now)
+        return int(self.tokens)
+
+    def take(self, now: float) -> float:
+        """
+        Забирает маркер. Вызывается под блокировкой владельца.
+
+        Returns:
+            float: 0, если маркер получен, иначе через сколько секунд он появится
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов по ключу (например, адрес клиента и маршрут).
+
+    Корзины хранятся в LRU ограниченного размера, поэтому поток запросов
+    с разных адресов не расходует память без предела. Лимиты действуют
+    в пределах процесса. clock - источник времени (в тестах подменяется).
+    """
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_CLIENTS, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: Hashable, rate: float, burst: int) -> float:
+        """
+        Учитывает запрос.
+
+        Returns:
+            float: 0, если запрос разрешен, иначе через сколько секунд повторить
+        """
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+                while len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class UpstreamBudget:
+    """
+    Общий для процесса бюджет обращений к внешнему API: не больше
+    max_concurrency одновременных запросов и не чаще qps в секунду.
+
+    Запрос сверх бюджета не ждет, а сразу отклоняется: лучше отдать
+    устаревшие данные или ошибку, чем копить очередь потоков.
+    clock - источник времени, как в RateLimiter.
+    """
+
+    def __init__(self, max_concurrency: int, qps: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max_concurrency
+        self._clock = clock
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._bucket = TokenBucket(qps, burst, clock()) if qps > 0 else None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Занимает место в бюджете; False, если бюджет исчерпан. После успеха вызвать release()."""
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            return False
+        if self._bucket is not None:
+            with self._lock:
+                allowed = self._bucket.take(self._clock()) == 0
+            if not allowed:
+                self.release()
+                return False
+        return True
+
+    def available(self) -> float:
+        """Сколько запросов бюджет пропустит сейчас по частоте (math.inf без ограничения)."""
+        if self._bucket is None:
+            return math.inf
+        with self._lock:
+            return self._bucket.available(self._clock())
+
+    def release(self) -> None:
+        if self._slots is not None:
+            self._slots.release()
+
+
+DEFAULT_LIMIT = parse_limit(RATE_LIMIT_DEFAULT)
+UPSTREAM_LIMIT = parse_limit(RATE_LIMIT_UPSTREAM)
+
+
+def route_limit(route: str) -> Optional[tuple[float, int]]:
+    """Лимит (запросов в секунду, запас) для маршрута или None, если маршрут не ограничивается."""
+    if route in EXEMPT_ROUTES:
+        return None
+    return UPSTREAM_LIMIT if route in UPSTREAM_ROUTES else DEFAULT_LIMIT
+
+
+client_limiter = RateLimiter()
+upstream_budget = UpstreamBudget(UPSTREAM_MAX_CONCURRENCY, UPSTREAM_QPS, UPSTREAM_BURST)
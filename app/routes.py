@@ -1,3 +1,12 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime
+from typing import Iterable, Iterator
+
 from flask import (
     Blueprint,
     Response,
@@ -8,20 +17,65 @@ from flask import (
     redirect,
     url_for,
     make_response,
+    stream_with_context,
 )
 from app import logger
-from app.api import get_weather
-from app.database.config_db import db_session, get_db
+from app.api import (
+    BATCH_MAX_CITIES,
+    EXTENDED_FORECAST_DAYS,
+    EXTENDED_FORECAST_HOURS,
+    async_get_weather_with_forecast,
+    get_extended_forecast,
+    get_weather_batch,
+    weather_ttl_left,
+)
+from app.cache import TTLCache
+from app.database.analytics import ANALYTICS_ROLLUP_INTERVAL, TOP_WINDOWS, get_top_cities, search_rollup
+from app.database.city_index import city_index
+from app.database.config_db import Session, db_session
+from app.database.history_buffer import HISTORY_WRITE_BEHIND, search_history_buffer
 from app.database.request_db import (
-    get_all_search_stats,
+    STATS_SORT_COLUMNS,
     get_or_create_city,
-    update_or_create_search_history,
+    get_search_stats_page,
+    get_search_stats_version,
+    iter_search_stats,
+    record_city_search,
     get_cities_by_prefix,
+    get_cities_fuzzy,
 )
+from app.http_cache import conditional_response, decode_cursor, encode_cursor, make_etag
+from app.metrics import render_metrics
 from app.utils import validate_city, InvalidCityError
 
 bp = Blueprint("main", __name__)
 
+# Сколько часов почасового прогноза показывать на странице погоды
+PAGE_FORECAST_HOURS = 24
+# Отрисованные страницы погоды живут, пока свежи данные, из которых они построены
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", 1000))
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_FUZZY = os.getenv("AUTOCOMPLETE_FUZZY", "1")
+AUTOCOMPLETE_MAX_AGE = int(os.getenv("AUTOCOMPLETE_MAX_AGE", 60))
+
+CITIES_PAGE_SIZE = 100
+CITIES_MAX_PAGE_SIZE = 1000
+CITIES_MAX_AGE = int(os.getenv("CITIES_MAX_AGE", 5))
+TOP_CITIES_LIMIT = 10
+TOP_CITIES_MAX_LIMIT = 100
+# Сколько строк статистики отправлять клиенту одним фрагментом при экспорте
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Готовые ответы /api/cities; ключ включает версию статистики,
+# поэтому любая запись истории поиска делает старые записи недоступными
+cities_response_cache = TTLCache("cities", maxsize=256, ttl=300)
+page_cache = TTLCache("pages", maxsize=PAGE_CACHE_SIZE, ttl=300)
+
 
 @bp.route("/", methods=["GET", "POST"])
 def index() -> Response | str:
@@ -39,8 +93,12 @@ def index() -> Response | str:
         try:
             city = validate_city(request.form.get("city"))
 
-            city_entry = get_or_create_city(db_session, city)
-            update_or_create_search_history(db_session, city_entry.id)
+            if HISTORY_WRITE_BEHIND:
+                search_history_buffer.add(get_or_create_city(db_session, city).id)
+            else:
+                record_city_search(db_session, city)
+            city_index.record_search(city)
+            search_rollup.start()
 
             response = make_response(redirect(url_for("main.show_weather", city=city)))
             response.set_cookie(
@@ -60,8 +118,13 @@ def index() -> Response | str:
     return render_template("index.html", last_city=last_city)
 
 
+def _weather_page_response(body: bytes, etag: str, ttl: float) -> Response:
+    """Страница погоды со строгим ETag и max-age, равным оставшейся свежести прогноза."""
+    return conditional_response(body, max(0, int(ttl)), etag=etag, mimetype="text/html")
+
+
 @bp.route("/weather/<city>")
-def show_weather(city) -> Response | str:
+async def show_weather(city) -> Response | str:
     """
     Страница с отображением погоды для указанного города.
 
@@ -69,15 +132,113 @@ def show_weather(city) -> Response | str:
         city (str): Название города
 
     Возвращает:
-        - HTML страницу с погодой или перенаправление на главную с ошибкой
+        - HTML страницу с текущей погодой, почасовым прогнозом на сутки и
+          посуточным на неделю (если он недоступен, показывается только текущая
+          погода) или перенаправление на главную с ошибкой
+
+    Отрисованная страница кэшируется, пока свежи текущая погода и прогноз,
+    поэтому повторные просмотры не обращаются ни к Open-Meteo, ни к Jinja.
+    ETag - хэш страницы, If-None-Match с ним дает 304.
     """
-    weather_data = get_weather(city)
+    try:
+        city = validate_city(city)
+    except InvalidCityError as e:
+        flash(str(e))
+        return redirect(url_for("main.index"))
+
+    cached = page_cache.get(city)
+    if cached is not None:
+        body, etag, expires_at = cached
+        return _weather_page_response(body, etag, expires_at - time.time())
+
+    weather_data, forecast = await async_get_weather_with_forecast(city, db_session, hours=PAGE_FORECAST_HOURS)
     if not weather_data:
         flash("Не удалось получить данные о погоде для этого города.")
         return redirect(url_for("main.index"))
 
-    response = render_template("weather.html", weather=weather_data)
-    return response
+    body = render_template("weather.html", weather=weather_data, forecast=forecast).encode()
+    etag = hashlib.sha1(body).hexdigest()
+
+    # Устаревшие данные и страница без прогноза не кэшируются: их нужно
+    # заменить, как только Open-Meteo снова ответит
+    ttl = 0.0 if weather_data.get("stale") or not forecast else weather_ttl_left(city)
+    if ttl > 0:
+        page_cache.set(city, (body, etag, time.time() + ttl), ttl=ttl)
+    return _weather_page_response(body, etag, ttl)
+
+
+@bp.route("/api/forecast/<city>")
+def forecast(city) -> Response:
+    """
+    API endpoint почасового и посуточного прогноза для города.
+
+    Параметры:
+    - hours: часов почасового прогноза, начиная с текущего (по умолчанию 24)
+    - days: дней посуточного прогноза, начиная с сегодняшнего (по умолчанию 7)
+
+    Возвращает:
+    - JSON с массивами значений по времени (в местном времени города):
+      {"city": str, "hourly": {"time": [...], "temperature_2m": [...], ...},
+       "daily": {"time": [...], "temperature_2m_max": [...], ...}}
+    - 400 при некорректном городе или параметрах, 502 если прогноз недоступен
+    """
+    try:
+        city = validate_city(city)
+        hours = int(request.args.get("hours", PAGE_FORECAST_HOURS))
+        days = int(request.args.get("days", EXTENDED_FORECAST_DAYS))
+    except InvalidCityError as e:
+        return jsonify({"error": str(e)}), 400
+    except ValueError:
+        return jsonify({"error": "hours и days должны быть целыми числами"}), 400
+
+    if not 1 <= hours <= EXTENDED_FORECAST_HOURS or not 1 <= days <= EXTENDED_FORECAST_DAYS:
+        return jsonify(
+            {"error": f"hours - от 1 до {EXTENDED_FORECAST_HOURS}, days - от 1 до {EXTENDED_FORECAST_DAYS}"}
+        ), 400
+
+    result = get_extended_forecast(city, db_session, hours=hours, days=days)
+    if result is None:
+        return jsonify({"error": "Не удалось получить прогноз для этого города"}), 502
+    return jsonify(result)
+
+
+@bp.route("/api/weather")
+def weather_batch() -> Response:
+    """
+    API endpoint для получения текущей погоды сразу для нескольких городов.
+
+    Параметры:
+    - cities: названия городов через запятую (не более BATCH_MAX_CITIES)
+
+    Возвращает:
+    - JSON-массив в порядке запроса, по одному объекту на город:
+      {"city": str, "weather": {...}} или {"city": str, "error": str}
+    - 400 если список городов пуст или слишком длинный
+    """
+    raw_cities = [c for c in request.args.get("cities", "").split(",") if c.strip()]
+
+    if not raw_cities:
+        return jsonify({"error": "Укажите города в параметре cities"}), 400
+    if len(raw_cities) > BATCH_MAX_CITIES:
+        return jsonify({"error": f"Можно запросить не более {BATCH_MAX_CITIES} городов"}), 400
+
+    results: list[dict] = []
+    valid_cities: list[str] = []
+    for raw_city in raw_cities:
+        try:
+            city = validate_city(raw_city)
+            results.append({"city": city})
+            if city not in valid_cities:
+                valid_cities.append(city)
+        except InvalidCityError as e:
+            results.append({"city": raw_city.strip(), "error": str(e)})
+
+    weather_by_city = {item["city"]: item for item in get_weather_batch(valid_cities, db_session)}
+    for result in results:
+        if "error" not in result:
+            result.update(weather_by_city[result["city"]])
+
+    return jsonify(results)
 
 
 @bp.route("/api/cities")
@@ -85,6 +246,13 @@ def cities() -> Response:
     """
     API endpoint для получения статистики поиска городов.
 
+    Параметры:
+    - sort: count (по умолчанию) или last_visited, по убыванию
+    - limit: размер страницы (1..1000, по умолчанию 100)
+    - offset: смещение
+    - after: курсор следующей страницы из заголовка X-Next-Cursor
+      (быстрее offset на дальних страницах)
+
     Возвращает:
         - JSON с массивом объектов статистики:
           {
@@ -92,17 +260,146 @@ def cities() -> Response:
             "count": int,
             "last_visited": str (ISO format)
           }
+        - Заголовки ETag, Last-Modified и Cache-Control; 304 при совпадении
+          If-None-Match / If-Modified-Since
+        - X-Next-Cursor и Link: rel="next", если есть следующая страница
+        - 400 при некорректных параметрах
     """
-    stats = get_all_search_stats(db_session)
-    result = [
-        {
-            "city": name,
-            "count": count,
-            "last_visited": last_visited.isoformat(),
-        }
-        for name, count, last_visited in stats
-    ]
-    return jsonify(result)
+    sort = request.args.get("sort", "count")
+    cursor = request.args.get("after")
+    try:
+        limit = int(request.args.get("limit", CITIES_PAGE_SIZE))
+        offset = int(request.args.get("offset", 0))
+        if sort not in STATS_SORT_COLUMNS or not 1 <= limit <= CITIES_MAX_PAGE_SIZE or offset < 0:
+            raise ValueError
+        after = None
+        if cursor:
+            value, city_id = decode_cursor(cursor)
+            # Значения курсора попадают в запрос как параметры: тип должен
+            # совпадать с колонкой сортировки, иначе SQLite не примет их
+            value_type = str if sort == "last_visited" else int
+            if type(value) is not value_type or type(city_id) is not int:
+                raise ValueError
+            if sort == "last_visited":
+                value = datetime.fromisoformat(value)
+            after = (value, city_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Некорректные параметры запроса"}), 400
+
+    version, updated_at = get_search_stats_version(db_session)
+    etag = make_etag(version, sort, limit, offset, cursor)
+
+    cached = cities_response_cache.get(etag)
+    if cached is None:
+        stats = get_search_stats_page(db_session, sort=sort, limit=limit, offset=offset, after=after)
+        result = [
+            {
+                "city": name,
+                "count": count,
+                "last_visited": last_visited.isoformat(),
+            }
+            for name, count, last_visited, _ in stats
+        ]
+        next_cursor = None
+        if len(stats) == limit:
+            last = stats[-1]
+            next_cursor = encode_cursor(last.count if sort == "count" else last.last_visited, last.city_id)
+        cached = (jsonify(result).get_data(), next_cursor)
+        cities_response_cache.set(etag, cached)
+
+    body, next_cursor = cached
+    response = conditional_response(body, CITIES_MAX_AGE, etag=etag, last_modified=updated_at)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{url_for("main.cities", sort=sort, limit=limit, after=next_cursor)}>; rel="next"'
+    return response
+
+
+@bp.route("/api/cities/top")
+def cities_top() -> Response:
+    """
+    API endpoint самых искомых городов за последний час, сутки или неделю.
+
+    Читает только почасовые/посуточные агрегаты, поэтому стоимость запроса
+    зависит от числа корзин в окне, а не от числа поисков.
+
+    Параметры:
+    - window: 1h, 24h (по умолчанию) или 7d
+    - limit: количество городов (1..100, по умолчанию 10)
+
+    Возвращает:
+        - JSON-массив {"city": str, "count": int}, самые искомые первыми
+        - 400 при некорректных параметрах
+    """
+    window = request.args.get("window", "24h")
+    try:
+        limit = int(request.args.get("limit", TOP_CITIES_LIMIT))
+        if window not in TOP_WINDOWS or not 1 <= limit <= TOP_CITIES_MAX_LIMIT:
+            raise ValueError
+    except ValueError:
+        windows = ", ".join(TOP_WINDOWS)
+        return jsonify({"error": f"window должен быть одним из: {windows}; limit - от 1 до {TOP_CITIES_MAX_LIMIT}"}), 400
+
+    search_rollup.start()
+    top = get_top_cities(db_session, window, limit)
+    body = jsonify([{"city": name, "count": count} for name, count in top]).get_data()
+    return conditional_response(body, int(ANALYTICS_ROLLUP_INTERVAL))
+
+
+def _export_chunks(rows: Iterable, file_format: str) -> Iterator[str]:
+    """Сериализует строки статистики фрагментами по EXPORT_CHUNK_SIZE строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if file_format == "csv":
+        writer.writerow(["city", "count", "last_visited"])
+
+    for number, (name, count, last_visited) in enumerate(rows, 1):
+        if file_format == "csv":
+            writer.writerow([name, count, last_visited.isoformat()])
+        else:
+            record = {"city": name, "count": count, "last_visited": last_visited.isoformat()}
+            buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if number % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@bp.route("/api/cities/export")
+def cities_export() -> Response:
+    """
+    Потоковая выгрузка статистики поиска по всем городам.
+
+    Строки читаются из БД пакетами и сразу отправляются клиенту, поэтому
+    память воркера не растет с размером таблицы.
+
+    Параметры:
+    - format: ndjson (по умолчанию) - по JSON-объекту на строку,
+      или csv - с заголовком city,count,last_visited
+
+    Возвращает:
+        - Поток строк {"city": str, "count": int, "last_visited": str}
+        - 400 при неизвестном формате
+    """
+    file_format = request.args.get("format", "ndjson")
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Формат должен быть одним из: {', '.join(EXPORT_FORMATS)}"}), 400
+
+    def generate() -> Iterator[str]:
+        # Отдельная сессия: чтение продолжается после выхода из представления
+        db = Session()
+        try:
+            yield from _export_chunks(iter_search_stats(db, batch_size=EXPORT_CHUNK_SIZE), file_format)
+        finally:
+            db.close()
+
+    logger.info("Экспорт статистики поиска в формате %s", file_format)
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[file_format])
+    response.headers["Content-Disposition"] = f"attachment; filename=cities.{file_format}"
+    return response
 
 
 @bp.route("/api/autocomplete")
@@ -112,9 +409,12 @@ def autocomplete() -> Response:
 
     Параметры:
     - q: строка поиска (минимум 2 символа)
+    - fuzzy: 1 - дополнять результаты поиска по префиксу нечетким поиском
+      (опечатки, транслитерация), 0 - только префикс
 
     Возвращает:
-    - JSON-массив с подходящими городами (максимум 10)
+    - JSON-массив с подходящими городами (максимум 10) с ETag и Cache-Control;
+      304 при совпадении If-None-Match
     - 400 если запрос слишком короткий
     - 500 при ошибке сервера
     """
@@ -124,14 +424,29 @@ def autocomplete() -> Response:
         if len(q) < 2:
             return jsonify({"error": "Строка поиска должна содержать минимум 2 символа"}), 400
 
-        db = next(get_db())
+        cities = get_cities_by_prefix(db_session, q, limit=AUTOCOMPLETE_LIMIT)
 
-        try:
-            cities = get_cities_by_prefix(db, q, limit=10)
-            return jsonify(cities)
-        finally:
-            db.close()
+        if request.args.get("fuzzy", AUTOCOMPLETE_FUZZY) == "1" and len(cities) < AUTOCOMPLETE_LIMIT:
+            for city in get_cities_fuzzy(db_session, q, limit=AUTOCOMPLETE_LIMIT):
+                if city not in cities:
+                    cities.append(city)
+            cities = cities[:AUTOCOMPLETE_LIMIT]
+
+        return conditional_response(jsonify(cities).get_data(), AUTOCOMPLETE_MAX_AGE)
 
     except Exception as e:
-        logger.error(f"Ошибка в автозаполнении: {str(e)}")
+        logger.error("Ошибка в автозаполнении: %s", e)
         return jsonify({"error": "Произошла ошибка при поиске городов"}), 500
+
+
+@bp.route("/metrics")
+def metrics() -> Response:
+    """
+    Метрики в формате Prometheus: задержки маршрутов, запросы к Open-Meteo,
+    SQL-запросы, ожидание пула соединений, кэши и запросы в обработке.
+
+    При запуске под gunicorn с PROMETHEUS_MULTIPROC_DIR значения
+    суммируются по всем воркерам.
+    """
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
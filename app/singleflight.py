@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная координация недоступна
+    fcntl = None
+
+from app.logger import logger
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых запросов.
+
+    Пока для ключа выполняется запрос, остальные вызовы с тем же ключом
+    не обращаются к внешнему API, а ждут результат первого. Работает между
+    потоками и корутинами одного процесса.
+
+    Если задан lock_dir, запросы дополнительно координируются между
+    процессами (воркерами gunicorn) через файловую блокировку: лидер
+    записывает результат в файл, и остальные процессы в течение shared_ttl
+    секунд читают его вместо повторного запроса. Просроченные файлы
+    удаляются не чаще раза в PRUNE_INTERVAL секунд.
+    """
+
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, name: str, lock_dir: Optional[str] = None, shared_ttl: float = 5.0):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.shared_ttl = shared_ttl
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """Возвращает future для ключа и признак того, что вызывающий - лидер."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], store: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Выполняет fn() один раз для всех одновременных вызовов с ключом key.
+
+        Args:
+            key (Hashable): Ключ запроса
+            fn (Callable): Функция, выполняющая запрос
+            store (Optional[Callable]): Обработка результата fn() в процессе,
+                например сохранение в кэш. Вызывается один раз и для ответа,
+                полученного самим процессом, и для прочитанного из общего файла,
+                поэтому в файл попадает необработанный ответ
+
+        Returns:
+            Any: Результат fn() (или store(), если задан), общий для всех ожидающих
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            with self._shared_lock(key):
+                result = self._read_shared(key)
+                if result is _MISSING:
+                    result = fn()
+                    self._write_shared(key, result)
+            if store is not None:
+                result = store(result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+            self._maybe_prune()
+
+    async def do_async(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]], store: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """
+        Асинхронная версия do(): ожидание не блокирует цикл событий.
+
+        Args:
+            key (Hashable): Ключ запроса
+            fn (Callable): Функция, возвращающая корутину запроса
+            store (Optional[Callable]): См. do()
+
+        Returns:
+            Any: Результат fn() (или store(), если задан), общий для всех ожидающих
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        lock_file = None
+        try:
+            lock_file = await asyncio.to_thread(self._acquire_shared, key)
+            result = self._read_shared(key)
+            if result is _MISSING:
+                result = await fn()
+                self._write_shared(key, result)
+            self._release_shared(lock_file)
+            lock_file = None
+            if store is not None:
+                result = store(result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._release_shared(lock_file)
+            self._finish(key)
+            if self._prune_due():
+                await asyncio.to_thread(self._maybe_prune)
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(f"{self.name}:{key}".encode()).hexdigest()
+        return os.path.join(self.lock_dir, digest)
+
+    def _acquire_shared(self, key: Hashable):
+        if not self.lock_dir:
+            return None
+        path = self._path(key) + ".lock"
+        while True:
+            lock_file = open(path, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Пока ждали, файл мог удалить _prune: тогда блокировка на нем
+            # ничего не защищает, и ее нужно взять на новом файле
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            self._release_shared(lock_file)
+
+    @staticmethod
+    def _release_shared(lock_file) -> None:
+        if lock_file is None:
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    @contextmanager
+    def _shared_lock(self, key: Hashable):
+        lock_file = self._acquire_shared(key)
+        try:
+            yield
+        finally:
+            self._release_shared(lock_file)
+
+    def _read_shared(self, key: Hashable) -> Any:
+        """Читает результат, недавно полученный другим процессом."""
+        if not self.lock_dir:
+            return _MISSING
+
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.shared_ttl:
+                return _MISSING
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception as e:
+            logger.warning("Не удалось прочитать общий результат %s: %s", self.name, e)
+            return _MISSING
+
+    def _write_shared(self, key: Hashable, result: Any) -> None:
+        """Публикует результат для других процессов (только успешные ответы)."""
+        if not self.lock_dir or result is None:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Не удалось сохранить общий результат %s: %s", self.name, e)
+
+    def _prune_due(self) -> bool:
+        return bool(self.lock_dir) and time.monotonic() - self._pruned_at >= self.PRUNE_INTERVAL
+
+    def _maybe_prune(self) -> None:
+        """Удаляет просроченные файлы результатов и блокировок, если пора."""
+        if not self._prune_due():
+            return
+        with self._lock:
+            if not self._prune_due():
+                return
+            self._pruned_at = time.monotonic()
+        try:
+            self._prune()
+        except OSError as e:
+            logger.warning("Не удалось очистить каталог %s: %s", self.lock_dir, e)
+
+    def _prune(self) -> int:
+        """
+        Удаляет файлы результатов старше shared_ttl вместе с их блокировками.
+        Занятые блокировки (запрос выполняется) не трогаются.
+
+        Returns:
+            int: Количество удаленных ключей
+        """
+        expired_before = time.time() - self.shared_ttl
+        removed = 0
+        for entry in os.scandir(self.lock_dir):
+            name, suffix = entry.name.partition(".")[::2]
+            if suffix == "lock":
+                path = os.path.join(self.lock_dir, name)
+                try:
+                    if os.path.getmtime(path) >= expired_before:
+                        continue
+                except FileNotFoundError:
+                    pass
+                lock_file = self._lock_path_nonblocking(entry.path)
+                if lock_file is None:
+                    continue
+                try:
+                    for stale in (path, entry.path):
+                        try:
+                            os.remove(stale)
+                        except FileNotFoundError:
+                            pass
+                    removed += 1
+                finally:
+                    self._release_shared(lock_file)
+            elif suffix.endswith("tmp") and entry.stat().st_mtime < expired_before - self.PRUNE_INTERVAL:
+                # Остаток записи, прерванной завершением процесса
+                os.remove(entry.path)
+        return removed
+
+    @staticmethod
+    def _lock_path_nonblocking(path: str):
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
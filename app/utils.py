@@ -1,5 +1,8 @@
 from typing import Optional
 
+# Как у столбца cities.name
+CITY_MAX_LENGTH = 100
+
 
 class InvalidCityError(Exception):
     """Исключение для невалидных названий городов."""
@@ -27,6 +30,9 @@ def validate_city(city: Optional[str]) -> str:
     if len(normalized_city) < 2:
         raise InvalidCityError("Название города слишком короткое.")
 
+    if len(normalized_city) > CITY_MAX_LENGTH:
+        raise InvalidCityError("Название города слишком длинное.")
+
     if not all(c.isalpha() or c.isspace() or c in "-'" for c in normalized_city):
         raise InvalidCityError("Название города содержит недопустимые символы.")
 
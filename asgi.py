@@ -0,0 +1,10 @@
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from main import app as flask_app
+
+# Размер пула потоков, в котором выполняются запросы Flask
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", 64))
+
+app = WSGIMiddleware(flask_app, workers=ASGI_THREADS)
@@ -0,0 +1,282 @@
+"""
+Нагрузочный тест основных эндпоинтов приложения.
+
+Для каждого сценария выполняет заданное число запросов с заданной
+параллельностью и выводит пропускную способность и задержки p50/p95/p99.
+Последовательность запросов определяется --seed, поэтому прогоны
+воспроизводимы.
+
+Примеры:
+    # против уже запущенного приложения
+    python benchmarks/bench.py --url http://127.0.0.1:8000
+
+    # поднять заглушку Open-Meteo и gunicorn на временной БД
+    python benchmarks/bench.py --spawn --workers 3
+
+    # сохранить результат и сравнить с эталоном (код выхода 1 при регрессии)
+    python benchmarks/bench.py --spawn --json result.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from urllib.parse import quote
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_openmeteo.py")
+
+CITIES = [
+    "Москва", "Санкт-петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний новгород",
+    "Челябинск", "Красноярск", "Самара", "Уфа", "Ростов-на-дону", "Омск", "Краснодар",
+    "Воронеж", "Пермь", "Волгоград", "Саратов", "Тюмень", "Тольятти", "Ижевск", "Барнаул",
+    "Ульяновск", "Иркутск", "Хабаровск", "Ярославль", "Владивосток", "Махачкала", "Томск",
+    "Оренбург", "Кемерово", "Новокузнецк", "Рязань", "Набережные челны", "Астрахань", "Киров",
+    "Пенза", "Балашиха", "Липецк", "Чебоксары", "Калининград", "Тула", "Ставрополь",
+    "Курск", "Улан-удэ", "Сочи", "Тверь", "Магнитогорск", "Иваново", "Брянск", "Белгород",
+]  # fmt: skip
+
+# Сценарий: функция, возвращающая (метод, путь, данные формы, ожидаемый статус)
+Scenario = Callable[[random.Random], tuple[str, str, Optional[dict], int]]
+
+SCENARIOS: dict[str, Scenario] = {
+    "search": lambda rng: ("POST", "/", {"city": rng.choice(CITIES)}, 302),
+    "weather": lambda rng: ("GET", f"/weather/{quote(rng.choice(CITIES))}", None, 200),
+    "cities": lambda rng: ("GET", "/api/cities", None, 200),
+    "autocomplete": lambda rng: (
+        "GET",
+        f"/api/autocomplete?q={quote(rng.choice(CITIES)[: rng.randint(2, 5)])}",
+        None,
+        200,
+    ),
+}
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(base_url: str, name: str, requests_count: int, concurrency: int, seed: int) -> dict:
+    """Выполняет сценарий и возвращает статистику задержек в миллисекундах."""
+    rng = random.Random(f"{seed}:{name}")
+    plan = [SCENARIOS[name](rng) for _ in range(requests_count)]
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(item: tuple[str, str, Optional[dict], int]) -> None:
+        nonlocal errors
+        method, path, data, expected = item
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, data=data, allow_redirects=False, timeout=30)
+            ok = response.status_code == expected
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, plan))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(requests_count / duration, 1),
+        "mean": round(statistics.fmean(latencies), 2),
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+    }
+
+
+def print_report(results: list[dict]) -> None:
+    header = f"{'сценарий':<14}{'запросов':>10}{'ошибок':>8}{'rps':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<14}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10}"
+            f"{r['p50']:>10}{r['p95']:>10}{r['p99']:>10}"
+        )
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Список регрессий относительно эталона: рост p95 или падение rps больше tolerance."""
+    by_name = {r["scenario"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        base = by_name.get(r["scenario"])
+        if base is None:
+            continue
+        if r["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p95 {base['p95']} -> {r['p95']} мс")
+        if r["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: rps {base['rps']} -> {r['rps']}")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} не отвечает {timeout} с")
+
+
+def spawn(args: argparse.Namespace, workdir: str) -> tuple[str, list[subprocess.Popen]]:
+    """Запускает заглушку Open-Meteo и приложение под gunicorn на временной БД."""
+    mock_port, app_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        DB_PATH=os.path.join(workdir, "bench.db"),
+        GEOCODING_API_URL=f"http://127.0.0.1:{mock_port}/v1/search",
+        FORECAST_API_URL=f"http://127.0.0.1:{mock_port}/v1/forecast",
+        PREWARM_LOCK_FILE=os.path.join(workdir, "prewarm.lock"),
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, "metrics"),
+    )
+    # Итоги запросов в лог не выводятся, как и журнал доступа gunicorn (--log-level warning)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    if not args.keep_limits:
+        # Весь тест идет с одного адреса, лимиты на клиента отклонили бы большую часть запросов
+        env.update(RATE_LIMIT_ENABLED="0", UPSTREAM_MAX_CONCURRENCY="0", UPSTREAM_QPS="0")
+    init_env = {name: value for name, value in env.items() if name != "PROMETHEUS_MULTIPROC_DIR"}
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "main", "init-db"],
+        cwd=ROOT_DIR,
+        env=init_env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    mock = subprocess.Popen(
+        [
+            sys.executable, MOCK_SCRIPT, "--port", str(mock_port),
+            "--latency", str(args.mock_latency),
+            "--error-rate", str(args.mock_error_rate),
+            "--rate-limit", str(args.mock_rate_limit),
+        ]  # fmt: skip
+    )
+    app = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "main:app",
+            "--workers", str(args.workers),
+            "--threads", str(args.threads),
+            "--bind", f"127.0.0.1:{app_port}",
+            "--log-level", "warning",
+        ],  # fmt: skip
+        cwd=ROOT_DIR,
+        env=env,
+    )
+    processes = [mock, app]
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        _wait_ready(f"http://127.0.0.1:{mock_port}/v1/search?name=test")
+        _wait_ready(base_url + "/")
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return base_url, processes
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест приложения погоды")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Адрес запущенного приложения")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую")
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=50, help="Запросов на прогрев перед замером")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Сохранить результат в файл")
+    parser.add_argument("--baseline", help="Файл эталонного результата для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение, доля")
+    spawn_group = parser.add_argument_group("запуск окружения (--spawn)")
+    spawn_group.add_argument("--spawn", action="store_true", help="Запустить заглушку Open-Meteo и gunicorn")
+    spawn_group.add_argument("--workers", type=int, default=3)
+    spawn_group.add_argument("--threads", type=int, default=4)
+    spawn_group.add_argument("--mock-latency", type=float, default=50, help="Задержка заглушки, мс")
+    spawn_group.add_argument("--mock-error-rate", type=float, default=0.0)
+    spawn_group.add_argument("--mock-rate-limit", type=float, default=0.0)
+    spawn_group.add_argument(
+        "--keep-limits", action="store_true", help="Не отключать лимиты частоты и бюджет запросов к Open-Meteo"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        print(f"Неизвестные сценарии: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    processes: list[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        base_url = args.url
+        try:
+            if args.spawn:
+                base_url, processes = spawn(args, workdir)
+
+            results = []
+            for name in names:
+                if args.warmup:
+                    run_scenario(base_url, name, args.warmup, args.concurrency, args.seed + 1)
+                results.append(run_scenario(base_url, name, args.requests, args.concurrency, args.seed))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=10)
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Проверка времени импорта приложения (холодный старт воркера и CLI).
+
+Запускает `python -X importtime -c "import main"` несколько раз, берет
+медиану суммарного времени импорта и выводит самые тяжелые модули.
+Дополнительно проверяет, что импорт не обращается к БД: ни файл базы по
+временному пути DB_PATH, ни файл кэша CACHE_SQLITE_PATH (импорт идет
+с CACHE_BACKEND=sqlite) не должны появиться.
+
+Примеры:
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --budget-ms 700 --top 20 --module main
+
+Код выхода 1, если медиана превышает бюджет или импорт создал файл БД.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Разбирает вывод -X importtime: модуль -> (собственное, суммарное время в мкс)."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure(module: str, workdir: str) -> tuple[dict[str, tuple[int, int]], bool]:
+    """Один холодный импорт в отдельном процессе; возвращает тайминги и признак обращения к БД."""
+    db_path = os.path.join(workdir, "import-check.db")
+    cache_path = os.path.join(workdir, "import-check-cache.db")
+    env = dict(
+        os.environ,
+        DB_PATH=db_path,
+        CACHE_BACKEND="sqlite",
+        CACHE_SQLITE_PATH=cache_path,
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    touched = [path for path in (db_path, cache_path) if os.path.exists(path)]
+    for path in touched:
+        os.remove(path)
+    return parse_importtime(result.stderr), bool(touched)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бюджет времени импорта приложения")
+    parser.add_argument("--module", default="main", help="Импортируемый модуль")
+    parser.add_argument("--budget-ms", type=float, default=700, help="Допустимая медиана, мс")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых тяжелых модулей показать")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    totals = []
+    touched_db = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(args.runs):
+            timings, touched = measure(args.module, workdir)
+            totals.append(timings[args.module][1] / 1000)
+            touched_db |= touched
+
+    print(f"{'модуль':<45}{'собств., мс':>14}{'всего, мс':>12}")
+    heaviest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[: args.top]
+    for name, (self_us, cumulative_us) in heaviest:
+        print(f"{name.strip():<45}{self_us / 1000:>14.1f}{cumulative_us / 1000:>12.1f}")
+
+    median = statistics.median(totals)
+    print(f"\nимпорт {args.module}: медиана {median:.0f} мс за {args.runs} запусков, бюджет {args.budget_ms:.0f} мс")
+
+    failed = False
+    if median > args.budget_ms:
+        print(f"ПРЕВЫШЕН БЮДЖЕТ на {median - args.budget_ms:.0f} мс", file=sys.stderr)
+        failed = True
+    if touched_db:
+        print("Импорт обращается к БД (создан файл DB_PATH или CACHE_SQLITE_PATH)", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
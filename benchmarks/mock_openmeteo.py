@@ -0,0 +1,160 @@
+"""
+Локальная заглушка API Open-Meteo для нагрузочных тестов.
+
+Отвечает на /v1/search (геокодирование) и /v1/forecast (current, hourly,
+daily, в т.ч. несколько точек через запятую) детерминированными данными.
+Задержку, долю ошибок 500 и ответов 429 можно настроить.
+
+Запуск:
+    python benchmarks/mock_openmeteo.py --port 8081 --latency 50 --error-rate 0.01
+
+Приложение направляется на заглушку переменными окружения:
+    GEOCODING_API_URL=http://127.0.0.1:8081/v1/search
+    FORECAST_API_URL=http://127.0.0.1:8081/v1/forecast
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _seed(*parts: object) -> float:
+    """Псевдослучайное число 0..1, одинаковое для одинаковых аргументов."""
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).digest()
+    return int.from_bytes(digest[:4], "big") / 2**32
+
+
+def geocode(name: str) -> dict:
+    return {
+        "results": [
+            {
+                "name": name,
+                "latitude": round(41 + _seed(name, "lat") * 28, 4),
+                "longitude": round(20 + _seed(name, "lon") * 150, 4),
+                "country": "Россия",
+                "timezone": "Europe/Moscow",
+            }
+        ]
+    }
+
+
+def _value(param: str, *parts: object) -> float:
+    if "probability" in param or "humidity" in param:
+        return round(_seed(param, *parts) * 100)
+    if "pressure" in param:
+        return round(990 + _seed(param, *parts) * 40, 1)
+    if "precipitation" in param:
+        return round(_seed(param, *parts) * 3, 1)
+    if "wind" in param:
+        return round(_seed(param, *parts) * 15, 1)
+    return round(-10 + _seed(param, *parts) * 35, 1)
+
+
+def forecast_point(lat: str, lon: str, query: dict) -> dict:
+    now = int(time.time())
+    hour = now // 3600 * 3600
+    result = {"latitude": float(lat), "longitude": float(lon), "utc_offset_seconds": 10800}
+
+    if "current" in query:
+        params = query["current"][0].split(",")
+        result["current"] = {"time": time.strftime("%Y-%m-%dT%H:%M", time.gmtime(now)), "interval": 900}
+        result["current"].update({p: _value(p, lat, lon, hour) for p in params})
+
+    if "hourly" in query:
+        hours = int(query.get("forecast_hours", ["48"])[0])
+        times = [hour + i * 3600 for i in range(hours)]
+        result["hourly"] = {"time": times}
+        result["hourly"].update({p: [_value(p, lat, lon, t) for t in times] for p in query["hourly"][0].split(",")})
+
+    if "daily" in query:
+        days = int(query.get("forecast_days", ["7"])[0])
+        day = now // 86400 * 86400 - result["utc_offset_seconds"]
+        times = [day + i * 86400 for i in range(days)]
+        result["daily"] = {"time": times}
+        result["daily"].update({p: [_value(p, lat, lon, t) for t in times] for p in query["daily"][0].split(",")})
+
+    return result
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: argparse.Namespace
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def _send(self, status: int, body: dict, headers: dict | None = None) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        settings = self.settings
+        with self.rng_lock:
+            delay = max(0.0, settings.latency + self.rng.uniform(-settings.jitter, settings.jitter)) / 1000
+            roll = self.rng.random()
+        time.sleep(delay)
+
+        if roll < settings.rate_limit:
+            self._send(429, {"error": True, "reason": "Too many requests"}, {"Retry-After": str(settings.retry_after)})
+            return
+        if roll < settings.rate_limit + settings.error_rate:
+            self._send(500, {"error": True, "reason": "Mock failure"})
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/v1/search" and "name" in query:
+            self._send(200, geocode(query["name"][0]))
+        elif url.path == "/v1/forecast" and "latitude" in query and "longitude" in query:
+            points = [
+                forecast_point(lat, lon, query)
+                for lat, lon in zip(query["latitude"][0].split(","), query["longitude"][0].split(","))
+            ]
+            self._send(200, points if len(points) > 1 else points[0])
+        else:
+            self._send(400, {"error": True, "reason": "Unsupported request"})
+
+    def log_message(self, format: str, *args) -> None:
+        if self.settings.verbose:
+            super().log_message(format, *args)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Заглушка Open-Meteo для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=50, help="Средняя задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=10, help="Разброс задержки, ± мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After для ответов 429, с")
+    parser.add_argument("--verbose", action="store_true", help="Логировать запросы")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    settings = parse_args(argv)
+    MockHandler.settings = settings
+    server = ThreadingHTTPServer((settings.host, settings.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Заглушка Open-Meteo: http://{settings.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
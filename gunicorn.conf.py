@@ -0,0 +1,35 @@
+import os
+import shutil
+import sys
+
+# Метрики воркеров складываются в общий каталог и суммируются в /metrics.
+# Переменная должна быть задана до импорта prometheus_client.
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = "/tmp/weather-metrics"
+
+from prometheus_client import multiprocess  # noqa: E402
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 3))
+# Приложение импортируется один раз в мастере, воркеры получают его через fork:
+# старт и перезапуск воркера не тратят время на импорт модулей
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    """Очищает метрики прошлого запуска."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """Воркер открывает собственные соединения с БД, а не пользуется соединениями мастера."""
+    config_db = sys.modules.get("app.database.config_db")
+    if config_db is not None:
+        config_db.dispose_engine()
+
+
+def child_exit(server, worker):
+    """Убирает из суммы gauge-метрики завершившегося воркера."""
+    multiprocess.mark_process_dead(worker.pid)
@@ -3,4 +3,8 @@ from app import create_app
 app = create_app()
 
 if __name__ == "__main__":
+    from app.database.models import init_db
+
+    # Для локального запуска без `flask init-db`: создать таблицы и применить миграции
+    init_db()
     app.run(debug=True)
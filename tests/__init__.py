@@ -0,0 +1,8 @@
+import os
+
+# До импорта модулей приложения: они читают настройки из окружения при импорте,
+# а load_dotenv() не переопределяет уже заданные переменные
+os.environ.setdefault("PREWARM_ENABLED", "0")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.database import config_db
+from app.database.models import init_db
+
+
+def _reset_engine() -> None:
+    if config_db._engine is not None:
+        config_db._engine.dispose()
+    config_db._engine = None
+
+
+def use_temp_database(test: unittest.TestCase) -> str:
+    """
+    Переключает приложение на пустую БД во временном каталоге до конца теста
+    и создает в ней таблицы.
+
+    Returns:
+        str: Путь к файлу БД
+    """
+    workdir = tempfile.TemporaryDirectory()
+    test.addCleanup(workdir.cleanup)
+    path = os.path.join(workdir.name, "test.db")
+
+    patcher = mock.patch.object(config_db, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{path}")
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+    _reset_engine()
+    test.addCleanup(_reset_engine)
+    init_db()
+    return path
@@ -0,0 +1,49 @@
+import fnmatch
+import time
+from typing import Callable, Iterator, Optional
+
+
+class FakeRedis:
+    """
+    Минимальная замена redis.Redis для тестов RedisCache: только get,
+    set(ex=...), delete и scan_iter. Срок жизни ключей считается по clock.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._data: dict[str, tuple[bytes, Optional[float]]] = {}
+
+    def _alive(self, key: str) -> bool:
+        item = self._data.get(key)
+        if item is None:
+            return False
+        expires_at = item[1]
+        if expires_at is not None and self.clock() >= expires_at:
+            del self._data[key]
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._data[key][0] if self._alive(key) else None
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> bool:
+        self._data[key] = (value, self.clock() + ex if ex is not None else None)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match: str = "*") -> Iterator[str]:
+        for key in list(self._data):
+            if self._alive(key) and fnmatch.fnmatchcase(key, match):
+                yield key
+
+
+class BrokenRedis:
+    """Клиент, у которого любая операция падает, как при недоступном сервере."""
+
+    def __getattr__(self, name: str):
+        def fail(*args, **kwargs):
+            raise ConnectionError("Redis недоступен")
+
+        return fail
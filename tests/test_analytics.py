@@ -0,0 +1,100 @@
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app import create_app
+from app.database.analytics import rollup_search_events, search_rollup
+from app.database.config_db import Session, get_engine
+from app.database.models import SearchEvent, SearchStatsDaily, SearchStatsHourly
+from app.database.request_db import get_or_create_city, search_event_insert
+from tests.db import use_temp_database
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        use_temp_database(self)
+        self.db = Session()
+        self.addCleanup(self.db.close)
+        self.now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def search(self, city: str, *ago: timedelta) -> int:
+        city_id = get_or_create_city(self.db, city).id
+        with get_engine().begin() as conn:
+            conn.execute(search_event_insert(), [{"b_city_id": city_id, "b_searched_at": self.now - a} for a in ago])
+        return city_id
+
+    def buckets(self, model) -> dict:
+        self.db.expire_all()
+        return {(row.bucket, row.city_id): row.count for row in self.db.scalars(select(model))}
+
+
+class RollupTest(AnalyticsTestCase):
+    def test_events_are_counted_in_hour_and_day_buckets(self):
+        ago = [timedelta(minutes=m) for m in (1, 20, 70, 130, 150)]
+        city_id = self.search("Омск", *ago)
+        searched = [self.now - a for a in ago]
+
+        self.assertEqual(rollup_search_events(), len(ago))
+
+        hours = Counter(t.replace(minute=0, second=0, microsecond=0) for t in searched)
+        days = Counter(t.replace(hour=0, minute=0, second=0, microsecond=0) for t in searched)
+        self.assertEqual(self.buckets(SearchStatsHourly), {(h, city_id): n for h, n in hours.items()})
+        self.assertEqual(self.buckets(SearchStatsDaily), {(d, city_id): n for d, n in days.items()})
+        self.assertEqual(self.db.scalar(select(func.count()).select_from(SearchEvent)), 0)
+
+    def test_repeated_rollup_adds_to_existing_buckets(self):
+        city_id = self.search("Омск", timedelta(0))
+        rollup_search_events()
+        self.search("Омск", timedelta(0), timedelta(0))
+
+        self.assertEqual(rollup_search_events(), 2)
+        self.assertEqual(rollup_search_events(), 0)
+        self.assertEqual(list(self.buckets(SearchStatsDaily).values()), [3])
+        hour = self.now.replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(self.buckets(SearchStatsHourly), {(hour, city_id): 3})
+
+    def test_old_buckets_are_dropped_after_retention(self):
+        self.search("Омск", timedelta(days=3), timedelta(days=100))
+        rollup_search_events()
+
+        self.assertEqual(self.buckets(SearchStatsHourly), {})
+        self.assertEqual(len(self.buckets(SearchStatsDaily)), 1)
+
+
+class TopCitiesApiTest(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = create_app().test_client()
+        self.addCleanup(search_rollup.stop)
+
+        minute, hours = timedelta(minutes=1), timedelta(hours=3)
+        self.search("Москва", minute, minute)
+        self.search("Казань", minute, minute)
+        self.search("Омск", minute, hours, hours, hours)
+        self.search("Томск", timedelta(days=3), timedelta(days=3), timedelta(days=3), timedelta(days=3), hours)
+        self.search("Самара", *[timedelta(days=8)] * 10)
+        rollup_search_events()
+
+    def top(self, window: str, limit: int = 10) -> list:
+        response = self.client.get(f"/api/cities/top?window={window}&limit={limit}")
+        self.assertEqual(response.status_code, 200)
+        return [(item["city"], item["count"]) for item in response.get_json()]
+
+    def test_top_is_ordered_by_count_then_name(self):
+        self.assertEqual(self.top("1h"), [("Казань", 2), ("Москва", 2), ("Омск", 1)])
+        self.assertEqual(self.top("24h"), [("Омск", 4), ("Казань", 2), ("Москва", 2), ("Томск", 1)])
+        self.assertEqual(self.top("7d"), [("Томск", 5), ("Омск", 4), ("Казань", 2), ("Москва", 2)])
+
+    def test_limit_keeps_the_most_searched(self):
+        self.assertEqual(self.top("7d", limit=2), [("Томск", 5), ("Омск", 4)])
+
+    def test_invalid_window_is_rejected(self):
+        for query in ("window=2h", "limit=0", "limit=abc"):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/cities/top?{query}").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import math
+import os
+import pickle
+import stat
+import tempfile
+import unittest
+from array import array
+from unittest import mock
+
+from app import cache
+from app.cache import RedisCache, SQLiteCache, create_cache, dump_value, load_value
+from app.forecast_series import ExtendedForecast, ForecastSeries
+from tests.fake_redis import BrokenRedis, FakeRedis
+
+
+class Clock:
+    """Управляемое время для проверки сроков жизни записей."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RedisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("app.cache.time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = FakeRedis(clock=self.clock)
+        self.cache = RedisCache("test", maxsize=10, ttl=60, client=self.client, retain=120)
+
+    def test_get_returns_fresh_value(self):
+        self.cache.set(("Москва", 1), {"temp": 5})
+
+        self.assertEqual(self.cache.get(("Москва", 1)), {"temp": 5})
+        self.assertIsNone(self.cache.get("нет такого"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_get_entry_keeps_metadata(self):
+        self.cache.set("key", "value", ttl=30)
+
+        entry = self.cache.get_entry("key")
+        self.assertEqual(entry.value, "value")
+        self.assertEqual(entry.stored_at, self.clock.now)
+        self.assertEqual(entry.expires_at, self.clock.now + 30)
+        self.assertTrue(entry.is_fresh)
+
+    def test_stale_entry_retained_until_retain_window_ends(self):
+        self.cache.set("key", "value")
+
+        self.clock.now += 90
+        self.assertIsNone(self.cache.get("key"))
+        entry = self.cache.get_entry("key")
+        self.assertEqual(entry.value, "value")
+        self.assertFalse(entry.is_fresh)
+
+        self.clock.now += 100
+        self.assertIsNone(self.cache.get_entry("key"))
+
+    def test_clear_removes_only_own_keys(self):
+        other = RedisCache("other", maxsize=10, ttl=60, client=self.client)
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        other.set("a", 3)
+
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(other.get("a"), 3)
+
+    def test_unavailable_server_acts_as_empty_cache(self):
+        broken = RedisCache("test", maxsize=10, ttl=60, client=BrokenRedis())
+
+        broken.set("key", "value")
+        self.assertIsNone(broken.get("key"))
+        self.assertIsNone(broken.get_entry("key"))
+        broken.delete("key")
+        broken.clear()
+        self.assertEqual(len(broken), 0)
+
+    def test_pickled_value_is_not_loaded(self):
+        self.client.set("weather:test:'key'", pickle.dumps(("value", 0, 0)))
+
+        self.assertIsNone(self.cache.get_entry("key"))
+
+    def test_create_cache_uses_redis_client(self):
+        with (
+            mock.patch.object(cache, "CACHE_BACKEND", "redis"),
+            mock.patch.object(cache, "_redis_client", self.client),
+        ):
+            created = create_cache("created", maxsize=10, ttl=60, retain=5)
+
+        self.assertIsInstance(created, RedisCache)
+        self.assertIs(created.client, self.client)
+        self.assertEqual(created.retain, 5)
+        created.set("key", "value")
+        self.assertEqual(created.get("key"), "value")
+
+
+class ValueCodecTest(unittest.TestCase):
+    def test_round_trip_keeps_tuples_and_forecasts(self):
+        series = ForecastSeries(array("q", [0, 3600]), {"temperature_2m": array("f", [1.5, math.nan])})
+        forecast = ExtendedForecast(series, series)
+        value = {"coords": (55.75, 37.62), "forecast": forecast, "items": [1, "a"]}
+
+        restored = load_value(dump_value(value))
+
+        self.assertEqual(restored["coords"], (55.75, 37.62))
+        self.assertEqual(restored["items"], [1, "a"])
+        self.assertIsInstance(restored["forecast"], ExtendedForecast)
+        self.assertEqual(restored["forecast"].hourly.slice(0, 2), forecast.hourly.slice(0, 2))
+
+    def test_invalid_payload_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            load_value(pickle.dumps({"a": 1}))
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.path = os.path.join(workdir.name, "cache.db")
+
+    def test_instances_share_entries(self):
+        writer = SQLiteCache("forecast", maxsize=10, ttl=60, path=self.path)
+        reader = SQLiteCache("forecast", maxsize=10, ttl=60, path=self.path)
+
+        writer.set((55.75, 37.62), {"temp": 5})
+
+        self.assertEqual(reader.get((55.75, 37.62)), {"temp": 5})
+        self.assertEqual(len(reader), 1)
+        reader.delete((55.75, 37.62))
+        self.assertIsNone(writer.get((55.75, 37.62)))
+
+    def test_file_is_private_and_created_lazily(self):
+        sqlite_cache = SQLiteCache("forecast", maxsize=10, ttl=60, path=self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+        sqlite_cache.set("key", "value")
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+
+if __name__ == "__main__":
+    unittest.main()
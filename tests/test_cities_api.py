@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from app import create_app
+from app.database.config_db import Session, get_engine
+from app.database.request_db import get_or_create_city, record_city_search, search_history_upsert
+from app.http_cache import encode_cursor
+from app.routes import cities_response_cache
+from tests.db import use_temp_database
+
+# Город -> (число поисков, сколько часов назад был последний поиск);
+# одинаковые значения проверяют порядок по city_id внутри них
+SEARCHES = {
+    "Москва": (5, 1),
+    "Омск": (3, 2),
+    "Томск": (3, 2),
+    "Казань": (3, 4),
+    "Самара": (1, 5),
+}
+
+
+class CitiesApiTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_database(self)
+        cities_response_cache.clear()
+        self.client = create_app().test_client()
+
+        now = datetime.now(timezone.utc)
+        db = Session()
+        try:
+            rows = [
+                {
+                    "b_city_id": get_or_create_city(db, name).id,
+                    "b_count": count,
+                    "b_last_visited": now - timedelta(hours=hours),
+                }
+                for name, (count, hours) in SEARCHES.items()
+            ]
+        finally:
+            db.close()
+        with get_engine().begin() as conn:
+            conn.execute(search_history_upsert(), rows)
+
+    def pages(self, sort: str, limit: int) -> list[list[str]]:
+        pages = []
+        response = self.client.get(f"/api/cities?sort={sort}&limit={limit}")
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item["city"] for item in response.get_json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return pages
+            response = self.client.get(f"/api/cities?sort={sort}&limit={limit}&after={cursor}")
+
+    def test_cursor_pages_match_full_list(self):
+        for sort in ("count", "last_visited"):
+            with self.subTest(sort=sort):
+                full = [item["city"] for item in self.client.get(f"/api/cities?sort={sort}").get_json()]
+                pages = self.pages(sort, limit=2)
+
+                self.assertEqual(len(full), len(SEARCHES))
+                self.assertEqual([city for page in pages for city in page], full)
+                self.assertEqual([len(page) for page in pages], [2, 2, 1])
+
+    def test_count_order_breaks_ties_by_newest_city(self):
+        cities = [item["city"] for item in self.client.get("/api/cities").get_json()]
+        self.assertEqual(cities, ["Москва", "Казань", "Томск", "Омск", "Самара"])
+
+    def test_bad_cursor_is_rejected(self):
+        for query in (
+            "after=not-a-cursor",
+            f"after={encode_cursor('5', 1)}",
+            f"after={encode_cursor(5, 'x')}",
+            f"sort=last_visited&after={encode_cursor(5, 1)}",
+            f"sort=last_visited&after={encode_cursor('вчера', 1)}",
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f"/api/cities?{query}").status_code, 400)
+
+    def test_etag_changes_after_new_search(self):
+        first = self.client.get("/api/cities")
+        etag = first.headers["ETag"]
+        self.assertEqual(self.client.get("/api/cities", headers={"If-None-Match": etag}).status_code, 304)
+
+        db = Session()
+        try:
+            record_city_search(db, "Самара")
+        finally:
+            db.close()
+
+        response = self.client.get("/api/cities", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        counts = {item["city"]: item["count"] for item in response.get_json()}
+        self.assertEqual(counts["Самара"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from app.database.city_index import CityPrefixIndex
+
+
+class RecordSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.index = CityPrefixIndex(refresh_interval=300, result_cache_size=100)
+        for name in ("Москва", "Мурманск", "Омск"):
+            self.index.add_city(name)
+
+    def test_search_reorders_prefixes_of_searched_city(self):
+        self.assertEqual(self.index.search("м", 10), ["Москва", "Мурманск"])
+
+        self.index.record_search("Мурманск")
+
+        self.assertEqual(self.index.search("м", 10), ["Мурманск", "Москва"])
+        self.assertEqual(self.index.search("мур", 10), ["Мурманск"])
+
+    def test_search_keeps_other_cached_results(self):
+        self.index.search("о", 10)
+
+        self.index.record_search("Мурманск")
+        hits = self.index._results.hits
+        self.index.search("о", 10)
+
+        self.assertEqual(self.index._results.hits, hits + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from app.database.config_db import Session, get_engine
+from app.database.history_buffer import SearchHistoryBuffer
+from app.database.models import SearchEvent, SearchHistory
+from app.database.request_db import (
+    get_or_create_city,
+    get_search_stats_version,
+    record_city_search,
+    search_history_upsert,
+)
+from tests.db import use_temp_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SearchHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_path = use_temp_database(self)
+        self.db = Session()
+        self.addCleanup(self.db.close)
+        self.city_id = get_or_create_city(self.db, "Омск").id
+
+    def history(self, city_id: int) -> SearchHistory:
+        self.db.expire_all()
+        return self.db.scalars(select(SearchHistory).where(SearchHistory.city_id == city_id)).one()
+
+    def event_count(self) -> int:
+        return self.db.scalar(select(func.count()).select_from(SearchEvent))
+
+
+class SearchHistoryUpsertTest(SearchHistoryTestCase):
+    def test_upsert_adds_count_and_keeps_latest_visit(self):
+        later = datetime(2025, 6, 2, tzinfo=timezone.utc)
+        earlier = later - timedelta(days=1)
+
+        with get_engine().begin() as conn:
+            conn.execute(search_history_upsert(), {"b_city_id": self.city_id, "b_count": 2, "b_last_visited": later})
+        with get_engine().begin() as conn:
+            conn.execute(search_history_upsert(), {"b_city_id": self.city_id, "b_count": 3, "b_last_visited": earlier})
+
+        history = self.history(self.city_id)
+        self.assertEqual(history.count, 5)
+        self.assertEqual(history.last_visited.replace(tzinfo=timezone.utc), later)
+
+    def test_record_city_search_creates_city_and_event(self):
+        city_id = record_city_search(self.db, "Томск")
+        record_city_search(self.db, "Томск")
+
+        self.assertEqual(self.history(city_id).count, 2)
+        self.assertEqual(self.event_count(), 2)
+
+
+class SearchHistoryBufferTest(SearchHistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = SearchHistoryBuffer(flush_interval=3600, flush_size=1000)
+        self.addCleanup(self.buffer._task.stop)
+
+    def test_flush_writes_pending_counts_and_events(self):
+        other_id = get_or_create_city(self.db, "Томск").id
+        for city_id in (self.city_id, self.city_id, other_id):
+            self.buffer.add(city_id)
+        version, _ = get_search_stats_version(self.db)
+
+        self.assertEqual(self.buffer.flush(), 2)
+
+        self.assertEqual(self.history(self.city_id).count, 2)
+        self.assertEqual(self.history(other_id).count, 1)
+        self.assertEqual(self.event_count(), 3)
+        self.assertGreater(get_search_stats_version(self.db)[0], version)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flush_merges_concurrent_searches(self):
+        record_city_search(self.db, "Омск")
+
+        def search():
+            for _ in range(50):
+                self.buffer.add(self.city_id)
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record_city_search(self.db, "Омск")
+        self.buffer.flush()
+
+        self.assertEqual(self.history(self.city_id).count, 202)
+        self.assertEqual(self.event_count(), 202)
+
+    def test_close_flushes_rest_of_buffer(self):
+        self.buffer.add(self.city_id)
+        self.buffer.close()
+
+        self.assertEqual(self.history(self.city_id).count, 1)
+
+    def test_buffer_is_flushed_at_exit(self):
+        script = (
+            "from app.database.history_buffer import search_history_buffer\n"
+            f"search_history_buffer.add({self.city_id})\n"
+            f"search_history_buffer.add({self.city_id})\n"
+        )
+        env = dict(os.environ, DB_PATH=self.db_path, HISTORY_FLUSH_INTERVAL="3600", LOG_LEVEL="ERROR")
+        subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, check=True, timeout=60)
+
+        self.assertEqual(self.history(self.city_id).count, 2)
+        self.assertEqual(self.event_count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
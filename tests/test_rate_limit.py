@@ -0,0 +1,135 @@
+import math
+import unittest
+from unittest import mock
+
+from app import create_app, rate_limit
+from app.rate_limit import RateLimiter, TokenBucket, UpstreamBudget, parse_limit
+from tests.db import use_temp_database
+
+
+class Clock:
+    """Управляемое время для проверки пополнения корзин."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_refill_at_rate(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+
+        self.assertEqual([bucket.take(0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(0), 0.5)
+        self.assertAlmostEqual(bucket.take(0.25), 0.25)
+        self.assertEqual(bucket.take(0.5), 0)
+        self.assertEqual(bucket.available(100), 3)
+
+    def test_clock_behind_last_update_does_not_take_tokens_back(self):
+        bucket = TokenBucket(rate=1, burst=1, now=10)
+        bucket.take(10)
+
+        self.assertGreater(bucket.take(9), 0)
+        self.assertEqual(bucket.take(11), 0)
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit("2/10"), (2.0, 10))
+        self.assertEqual(parse_limit("0.5"), (0.5, 1))
+        with self.assertRaises(ValueError):
+            parse_limit("много")
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = RateLimiter(maxsize=2, clock=self.clock)
+
+    def test_keys_are_limited_separately(self):
+        self.assertEqual(self.limiter.hit("a", 1, 1), 0)
+        self.assertEqual(self.limiter.hit("a", 1, 1), 1)
+        self.assertEqual(self.limiter.hit("b", 1, 1), 0)
+
+        self.clock.now += 1
+        self.assertEqual(self.limiter.hit("a", 1, 1), 0)
+
+    def test_least_recent_key_is_evicted(self):
+        self.limiter.hit("a", 1, 1)
+        self.limiter.hit("b", 1, 1)
+        self.limiter.hit("c", 1, 1)
+
+        # Корзина "a" вытеснена и создается заново полной
+        self.assertEqual(self.limiter.hit("a", 1, 1), 0)
+        self.assertEqual(self.limiter.hit("c", 1, 1), 1)
+
+
+class UpstreamBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_rate_is_limited_by_qps_and_burst(self):
+        budget = UpstreamBudget(max_concurrency=0, qps=2, burst=3, clock=self.clock)
+
+        self.assertEqual(budget.available(), 3)
+        self.assertEqual([budget.acquire() for _ in range(4)], [True, True, True, False])
+        self.clock.now += 0.5
+        self.assertEqual(budget.available(), 1)
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+
+    def test_concurrency_slots_are_released(self):
+        budget = UpstreamBudget(max_concurrency=2, qps=0, burst=0, clock=self.clock)
+
+        self.assertTrue(budget.acquire())
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+        budget.release()
+        self.assertTrue(budget.acquire())
+        self.assertEqual(budget.available(), math.inf)
+
+    def test_rejected_rate_frees_concurrency_slot(self):
+        budget = UpstreamBudget(max_concurrency=1, qps=1, burst=1, clock=self.clock)
+
+        self.assertTrue(budget.acquire())
+        budget.release()
+        self.assertFalse(budget.acquire())
+        self.clock.now += 1
+        self.assertTrue(budget.acquire())
+
+
+class ClientRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        use_temp_database(self)
+        self.clock = Clock()
+        for name, value in (
+            ("RATE_LIMIT_ENABLED", True),
+            ("client_limiter", RateLimiter(clock=self.clock)),
+            ("DEFAULT_LIMIT", (1.0, 2)),
+        ):
+            patcher = mock.patch.object(rate_limit, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = create_app().test_client()
+
+    def get(self, path: str, addr: str = "10.0.0.1"):
+        return self.client.get(path, environ_base={"REMOTE_ADDR": addr})
+
+    def test_requests_over_limit_get_429_with_retry_after(self):
+        self.assertEqual([self.get("/api/cities").status_code for _ in range(2)], [200, 200])
+
+        response = self.get("/api/cities")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+        self.assertEqual(self.get("/api/cities", addr="10.0.0.2").status_code, 200)
+        self.clock.now += 1
+        self.assertEqual(self.get("/api/cities").status_code, 200)
+
+    def test_metrics_are_not_limited(self):
+        statuses = {self.get("/metrics").status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+
+
+if __name__ == "__main__":
+    unittest.main()
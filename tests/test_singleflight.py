@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.singleflight import SingleFlight
+
+
+class SharedSingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.lock_dir = workdir.name
+
+    def test_store_runs_for_result_read_from_other_process(self):
+        leader = SingleFlight("forecast", lock_dir=self.lock_dir)
+        other = SingleFlight("forecast", lock_dir=self.lock_dir)
+        stored = []
+
+        self.assertEqual(leader.do("key", lambda: {"current": 1}, store=lambda r: r["current"]), 1)
+        fetch = mock.Mock(return_value={"current": 2})
+        result = other.do("key", fetch, store=lambda r: stored.append(r) or r["current"])
+
+        fetch.assert_not_called()
+        self.assertEqual(result, 1)
+        self.assertEqual(stored, [{"current": 1}])
+
+    def test_failed_result_is_not_shared(self):
+        flight = SingleFlight("forecast", lock_dir=self.lock_dir)
+        flight.do("key", lambda: None)
+
+        fetch = mock.Mock(return_value={"current": 1})
+        flight.do("key", fetch)
+        fetch.assert_called_once()
+
+    def test_prune_removes_expired_files(self):
+        flight = SingleFlight("forecast", lock_dir=self.lock_dir, shared_ttl=0)
+        for key in range(3):
+            flight.do(key, lambda: {"current": 1})
+        self.assertEqual(len(os.listdir(self.lock_dir)), 6)
+
+        self.assertEqual(flight._prune(), 3)
+        self.assertEqual(os.listdir(self.lock_dir), [])
+
+    def test_prune_keeps_locked_key(self):
+        flight = SingleFlight("forecast", lock_dir=self.lock_dir, shared_ttl=0)
+        flight.do("busy", lambda: {"current": 1})
+
+        with flight._shared_lock("busy"):
+            self.assertEqual(flight._prune(), 0)
+        self.assertEqual(flight._prune(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()